@@ -1,5 +1,4 @@
 import streamlit as st
-from langchain_groq import ChatGroq
 import time
 import os
 from dotenv import load_dotenv
@@ -8,15 +7,47 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from config import Config
-from prompt import build_prompt
-from pdf_generator import save_pdf
+from prompt import build_generation_prompt
+from pdf_generator import (
+    render_pdf,
+    render_exam_pack,
+    render_batch,
+    render_exam_book,
+    zip_pdfs,
+    persist_pdf,
+    content_address
+)
+from variants import make_variants
+from generator import (
+    stream_mcqs,
+    generate_chunked,
+    continue_truncated,
+    repair_quiz,
+    explain_questions,
+    start_explanations,
+    explanation_budget,
+    token_budget
+)
+from quiz import QuizSet, parse_quiz
+from cache import cacheable, get_cache, get_single_flight, make_key
+from dedup import get_seen_questions
+from bootstrap import initialize, get_css, get_llm
+from rate_limiter import is_retryable
+from llm_backend import choose_model
 from auth import (
-    create_tables,
     signup,
     login,
     save_history,
+    update_session_quiz,
     get_sessions,
-    get_session_data
+    get_session_data,
+    get_user_stats,
+    record_generation,
+    record_model_usage,
+    get_model_stats,
+    save_questions,
+    find_questions,
+    SESSION_PAGE_SIZE
 )
 
 # ----------------------------
@@ -24,15 +55,13 @@ from auth import (
 # ----------------------------
 st.set_page_config(**Config.UI_CONFIG)
 
-# Validate configuration
-if not Config.validate_config():
+# Validate configuration and set up the database (once per process)
+if not initialize():
     st.error("❌ Configuration validation failed. Please check your setup.")
     st.stop()
 
 # Apply professional styling
-st.markdown(Config.get_css_styles(), unsafe_allow_html=True)
-
-create_tables()
+st.markdown(get_css(), unsafe_allow_html=True)
 
 if "logged_in" not in st.session_state:
     st.session_state.logged_in = False
@@ -134,23 +163,40 @@ with st.sidebar:
     
     st.markdown("---")
     
-    # Statistics
-    sessions = get_sessions(st.session_state.user)
+    # Statistics (one row, maintained incrementally by auth.py)
+    user_stats = get_user_stats(st.session_state.user)
     st.markdown("### 📊 Your Stats")
     
     col1, col2 = st.columns(2)
     with col1:
-        st.metric("Total Sessions", len(sessions))
+        st.metric("Total Sessions", user_stats["sessions"])
+        st.metric("Tokens Spent", f"{user_stats['tokens']:,}")
     with col2:
-        # Calculate total questions (assuming 5 per session on average)
-        total_questions = len(sessions) * 5
-        st.metric("Questions Created", f"{total_questions}+")
+        st.metric("Questions Created", user_stats["questions"])
+        st.metric("Avg Generation", f"{user_stats['avg_latency']:.1f}s")
+    
+    levels = user_stats["levels"]
+    st.caption(f"Easy {levels['Easy']} • Medium {levels['Medium']} • Hard {levels['Hard']}")
     
     st.markdown("---")
     
     # Previous sessions
     st.markdown("### 📚 Previous Sessions")
     
+    search = st.text_input(
+        "🔍 Search topics",
+        key="history_search",
+        placeholder="Topic starts with..."
+    ).strip()
+    
+    # Pages already loaded are kept in the session so reruns skip the query
+    if "history_rows" not in st.session_state or st.session_state.get("history_query") != search:
+        page = get_sessions(st.session_state.user, search=search)
+        st.session_state.history_query = search
+        st.session_state.history_rows = page
+        st.session_state.history_has_more = len(page) == SESSION_PAGE_SIZE
+    sessions = st.session_state.history_rows
+    
     if not sessions:
         st.info("No previous sessions found. Create your first MCQ set!")
     else:
@@ -166,11 +212,83 @@ with st.sidebar:
                 ):
                     data = get_session_data(session_id)
                     if data:
-                        topic_loaded, mcq_text = data
+                        topic_loaded, mcq_text, mcq_json = data
                         st.session_state.mcqs = mcq_text
+                        st.session_state.quiz = (
+                            QuizSet.from_json(mcq_json) if mcq_json
+                            else parse_quiz(mcq_text, topic=topic_loaded)
+                        )
+                        st.session_state.pop("pdf_bytes", None)
+                        st.session_state.pop("exam_pack", None)
+                        st.session_state.pop("explain_future", None)
+                        st.session_state.pop("full_cache_key", None)
+                        st.session_state.session_id = session_id
                         st.session_state.loaded_topic = topic_loaded
                         st.success(f"✅ Loaded: {topic_loaded}")
                         st.rerun()
+        
+        if st.session_state.history_has_more and st.button("⬇️ Load more", use_container_width=True):
+            last_id, _, last_date = sessions[-1]
+            page = get_sessions(st.session_state.user, before=(last_date, last_id), search=search)
+            st.session_state.history_rows = sessions + page
+            st.session_state.history_has_more = len(page) == SESSION_PAGE_SIZE
+            st.rerun()
+        
+        # Several saved sets at once, rendered across CPU cores
+        with st.expander("📦 Export Several Sessions"):
+            # Keyed by session id: one topic can be saved several times a day
+            labels = {session_id: f"{topic} ({date[:16]})" for session_id, topic, date in sessions}
+            picked = st.multiselect("Sessions", list(labels), format_func=labels.get, key="export_pick")
+            export_mode = st.radio("Format", ["📚 Exam book (one PDF)", "🗂️ Separate PDFs (zip)"], key="export_mode")
+            with_answers = st.checkbox("Include answers and explanations", value=True, key="export_answers")
+            
+            if st.button("📦 Export", use_container_width=True, disabled=not picked):
+                try:
+                    quizzes = []
+                    for session_id in picked:
+                        topic_loaded, mcq_text, mcq_json = get_session_data(session_id)
+                        quizzes.append(
+                            QuizSet.from_json(mcq_json) if mcq_json
+                            else parse_quiz(mcq_text, topic=topic_loaded)
+                        )
+                    if export_mode.startswith("📚"):
+                        with st.spinner(f"📚 Binding {len(quizzes)} sets into one book..."):
+                            st.session_state.export_file = (
+                                "exam_book.pdf",
+                                render_exam_book(
+                                    quizzes, user_email=st.session_state.user, include_answers=with_answers
+                                ),
+                                "application/pdf"
+                            )
+                    else:
+                        progress_bar = st.progress(0)
+                        papers = render_batch(
+                            quizzes,
+                            user_email=st.session_state.user,
+                            include_answers=with_answers,
+                            on_progress=lambda done, total: progress_bar.progress(done / total)
+                        )
+                        progress_bar.empty()
+                        st.session_state.export_file = (
+                            "mcq_sets.zip",
+                            zip_pdfs(
+                                (f"{index:02d}_{content_address(quiz, quiz.topic)}", paper)
+                                for index, (quiz, paper) in enumerate(zip(quizzes, papers), start=1)
+                            ),
+                            "application/zip"
+                        )
+                except Exception as e:
+                    st.error(f"❌ Error exporting sessions: {str(e)}")
+            
+            if st.session_state.get("export_file"):
+                file_name, data, mime = st.session_state.export_file
+                st.download_button(
+                    f"⬇️ Download {file_name}",
+                    data=data,
+                    file_name=file_name,
+                    mime=mime,
+                    use_container_width=True
+                )
 
 # ----------------------------
 # MAIN APPLICATION INTERFACE
@@ -224,6 +342,25 @@ with st.form("mcq_form"):
         - Hard: Complex analysis and evaluation
         """)
     
+    force_fresh = st.checkbox(
+        "🔄 Force fresh generation",
+        value=False,
+        help="Skip the shared cache and always ask the AI for a new set"
+    )
+    
+    questions_first = st.checkbox(
+        "⚡ Questions first (explanations load afterwards)",
+        value=Config.AI_CONFIG["lazy_explanations"],
+        help="Show questions and the answer key sooner; explanations are fetched in the background"
+    )
+    explanations = not questions_first
+    
+    model_choice = st.selectbox(
+        "🧭 Model",
+        ["Auto (fastest suitable)", Config.AI_CONFIG["model_name"], Config.ROUTING["small_model"]],
+        help="Auto sends small Easy/Medium sets to the faster model and Hard sets to the large one"
+    )
+    
     # Professional generate button
     submitted = st.form_submit_button("🚀 Generate MCQs", use_container_width=True, type="primary")
     
@@ -233,57 +370,300 @@ with st.form("mcq_form"):
         else:
             with st.spinner("🤖 AI is crafting your questions... This may take a moment"):
                 try:
-                    # Get API key from environment
-                    groq_api_key = os.getenv("GROQ_API_KEY")
-                    
-                    if not groq_api_key:
-                        st.error("❌ GROQ_API_KEY not found. Please set your Groq API key as an environment variable.")
-                        st.info("📌 Add GROQ_API_KEY to your .env file or environment variables.")
+                    cache = get_cache()
+                    if model_choice.startswith("Auto"):
+                        model_name = choose_model(num_questions, level, get_model_stats(num_questions))
                     else:
-                        llm = ChatGroq(
-                            model=Config.AI_CONFIG["model_name"],
-                            api_key=groq_api_key,
-                            temperature=0.7,
-                            max_tokens=2000
+                        model_name = model_choice
+                    cache_key = make_key(topic, num_questions, level, model_name, explanations=explanations)
+                    full_cache_key = make_key(topic, num_questions, level, model_name)
+                    cached_text = None
+                    served_message = "⚡ Served instantly from the shared cache"
+                    banked = []
+                    seen = get_seen_questions() if Config.DEDUP["enabled"] else None
+                    seen_index = seen.index(st.session_state.user) if seen else None
+                    if Config.CACHE["enabled"] and not force_fresh:
+                        # A complete set also satisfies a questions-first request
+                        cached_text = cache.get(full_cache_key) or cache.get(cache_key)
+                    if cached_text and seen_index is not None and any(
+                        seen_index.match(q.stem) for q in parse_quiz(cached_text)
+                    ):
+                        # This user already had questions from the cached set
+                        cached_text = None
+                    if not cached_text and Config.BANK["enabled"] and not force_fresh:
+                        # Reuse stored questions; the AI only writes the shortfall
+                        banked = find_questions(
+                            topic, level, num_questions, exclude=seen_index.match if seen_index else None
                         )
-                        prompt = build_prompt(topic, num_questions, level)
-                        
-                        # Professional progress indication
-                        progress_bar = st.progress(0)
-                        status_text = st.empty()
-                        
-                        for i in range(100):
-                            time.sleep(0.02)
-                            progress_bar.progress(i + 1)
-                            if i < 30:
-                                status_text.text("🧠 AI analyzing your topic...")
-                            elif i < 60:
-                                status_text.text("📝 Generating questions...")
-                            elif i < 90:
-                                status_text.text("🎯 Crafting answer options...")
-                            else:
-                                status_text.text("✨ Finalizing your MCQ set...")
-                        
-                        response = llm.invoke(prompt)
-                        response_text = response.content if hasattr(response, 'content') else str(response)
+                        if len(banked) == num_questions:
+                            cached_text = QuizSet(banked, topic, level).to_text()
+                            served_message = "📚 Assembled from the question bank - no AI call needed"
                     
-                        # Clear progress indicators
-                        progress_bar.empty()
-                        status_text.empty()
-                        
-                        st.session_state.mcqs = response_text
+                    if cached_text:
+                        st.session_state.mcqs = cached_text
+                        st.session_state.quiz = parse_quiz(cached_text, topic=topic, level=level)
+                        st.session_state.pop("pdf_bytes", None)
+                        st.session_state.pop("exam_pack", None)
+                        st.session_state.pop("explain_future", None)
+                        st.session_state.pop("session_id", None)
+                        st.session_state.full_cache_key = full_cache_key
                         st.session_state.current_topic = topic
                         st.session_state.current_level = level
                         st.session_state.current_num = num_questions
+                        if seen:
+                            seen.record(st.session_state.user, st.session_state.quiz)
                         
-                        st.success(Config.MESSAGES["mcq_success"])
-                        st.balloons()
+                        st.success(served_message)
+                    else:
+                        # Get API key from environment
+                        groq_api_key = os.getenv("GROQ_API_KEY")
+                    
+                        if not groq_api_key and Config.AI_CONFIG["backend"] == "groq":
+                            st.error("❌ GROQ_API_KEY not found. Please set your Groq API key as an environment variable.")
+                            st.info("📌 Add GROQ_API_KEY to your .env file or environment variables.")
+                        else:
+                            need = num_questions - len(banked)
+                            if banked:
+                                st.info(f"📚 Reusing {len(banked)} question(s) from the question bank - generating the other {need}...")
+                            
+                            # Size the completion limit to the request so long Hard sets fit
+                            llm = get_llm(
+                                groq_api_key,
+                                model_name,
+                                max_tokens=token_budget(
+                                    min(need, Config.AI_CONFIG["chunk_size"]), level, explanations
+                                )
+                            )
+                            
+                            # Earlier questions on this topic the user should not get again
+                            avoid = seen.recent(st.session_state.user, topic) if seen else None
+                            
+                            def generate():
+                                """Run the LLM calls for this request; shared by identical concurrent requests."""
+                                started = time.perf_counter()
+                                
+                                def show_wait(position, waited):
+                                    status_text.text(
+                                        f"⏳ High demand - you are #{position} in the queue "
+                                        f"(waiting {waited:.0f}s)..."
+                                    )
+                            
+                                if need > Config.AI_CONFIG["chunk_size"]:
+                                    # Large sets run as parallel chunks of a few questions each
+                                    progress_bar = st.progress(0)
+                                    status_text = st.empty()
+                                
+                                    def show_chunk(done, total):
+                                        progress_bar.progress(done / total)
+                                        status_text.text(f"📝 {done}/{total} question batches ready...")
+                                
+                                    routes = set()
+                                    generated, tokens = generate_chunked(
+                                        llm, topic, need, level,
+                                        on_chunk=show_chunk,
+                                        on_wait=show_wait,
+                                        explanations=explanations,
+                                        avoid=avoid,
+                                        routes=routes
+                                    )
+                                
+                                    progress_bar.empty()
+                                    status_text.empty()
+                                    st.caption(f"⏱️ Generated in {time.perf_counter() - started:.2f}s")
+                                else:
+                                    prompt = build_generation_prompt(
+                                        topic, need, level, explanations=explanations, avoid=avoid
+                                    )
+                        
+                                    # Live generation feedback driven by the token stream
+                                    status_text = st.empty()
+                                    questions_area = st.container()
+                                    status_text.text("🧠 Waiting for the first token...")
+                        
+                                    def show_question(index, block):
+                                        questions_area.text(block)
+                        
+                                    def show_progress(stats):
+                                        status_text.text(
+                                            f"📝 Streaming... first token in {stats.ttft:.2f}s • "
+                                            f"{stats.tokens} tokens • {stats.tokens_per_sec:.0f} tok/s"
+                                        )
+                        
+                                    generated, stats = stream_mcqs(
+                                        llm,
+                                        prompt,
+                                        on_question=show_question,
+                                        on_progress=show_progress,
+                                        on_wait=show_wait,
+                                        topic=topic,
+                                        level=level
+                                    )
+                        
+                                    # Fetch only the questions lost if the response was cut off
+                                    status_text.text("🧩 Checking the response is complete...")
+                                    generated, extra_tokens = continue_truncated(
+                                        llm, generated, need,
+                                        finish_reason=stats.finish_reason,
+                                        on_wait=show_wait,
+                                        explanations=explanations,
+                                        json_reply=stats.json_reply
+                                    )
+                                    if extra_tokens:
+                                        st.info("✂️ The response was cut off - the missing questions were generated separately.")
+                                    if stats.route in ("hedge", "fallback"):
+                                        st.caption(f"🛟 Answered by the backup model ({Config.AI_CONFIG['fallback_model']})")
+                        
+                                    status_text.empty()
+                                    ttft = f"{stats.ttft:.2f}s" if stats.ttft is not None else "n/a"
+                                    st.caption(
+                                        f"⏱️ First token: {ttft} • Total: {stats.elapsed:.2f}s • "
+                                        f"{stats.tokens} tokens at {stats.tokens_per_sec:.0f} tok/s"
+                                    )
+                                    tokens = stats.tokens + extra_tokens
+                                    routes = {stats.route}
+                        
+                                # Banked questions lead; regenerate only those that break the format rules
+                                quiz = QuizSet(list(banked), topic, level)
+                                quiz.extend(generated.questions)
+                                failing = set(quiz.defects(require_explanation=explanations))
+                                if seen_index is not None:
+                                    failing.update(i for i, q in enumerate(quiz.questions) if seen_index.match(q.stem))
+                                failing = len(failing) + max(0, num_questions - len(quiz))
+                                if failing:
+                                    with st.spinner(f"🔧 Fixing {failing} incomplete or duplicate question(s)..."):
+                                        quiz, repair_tokens = repair_quiz(
+                                            llm, quiz, num_questions, on_wait=show_wait,
+                                            explanations=explanations, seen=seen_index
+                                        )
+                                    tokens += repair_tokens
+                                # Both paths report the whole request: first call, continuations and repairs
+                                return quiz, tokens, time.perf_counter() - started, routes
+                        
+                            def show_joined():
+                                st.info("🤝 Someone is generating this exact quiz right now - sharing their result...")
+                            
+                            started = time.perf_counter()
+                            # With dedup the avoid list and repairs depend on the user, so only
+                            # that user's own duplicate requests may share a generation
+                            flight_key = f"{cache_key}|{st.session_state.user}" if seen else cache_key
+                            (quiz, tokens, latency, routes), shared = get_single_flight().do(
+                                flight_key, generate, on_join=show_joined
+                            )
+                            if shared:
+                                # The leading session already paid for these tokens, and
+                                # fills in explanations on its own copy of the set
+                                tokens, latency = 0, time.perf_counter() - started
+                                quiz = QuizSet.from_dict(quiz.to_dict())
+                            response_text = quiz.to_text()
+                        
+                            record_generation(st.session_state.user, tokens, latency)
+                            backup = {"hedge", "fallback"}
+                            if not routes & backup:
+                                answered = model_name
+                            elif routes <= backup:
+                                answered = Config.AI_CONFIG["fallback_model"]
+                            else:
+                                answered = None  # chunks split across both models
+                            if not shared:
+                                # A backup model's latency includes the wait on the primary before
+                                # it was called, so only primary-only requests feed routing stats
+                                if not routes & backup:
+                                    record_model_usage(model_name, need, tokens, latency)
+                                save_questions(quiz, answered or model_name)
+                            st.caption(f"🧭 Model: {answered or model_name}")
+                            if seen:
+                                repeats = seen.duplicates(st.session_state.user, quiz)
+                                if repeats:
+                                    numbers = ", ".join(str(i + 1) for i in sorted(repeats))
+                                    st.warning(f"🔁 Question(s) {numbers} closely match ones you have had before.")
+                                seen.record(st.session_state.user, quiz)
+                            # A set repairs could not fix stays out of the shared cache
+                            if Config.CACHE["enabled"] and not shared and cacheable(quiz, num_questions, explanations):
+                                cache.put(cache_key, response_text)
+                            
+                            st.session_state.mcqs = response_text
+                            st.session_state.quiz = quiz
+                            st.session_state.pop("pdf_bytes", None)
+                            st.session_state.pop("exam_pack", None)
+                            st.session_state.pop("session_id", None)
+                            st.session_state.full_cache_key = full_cache_key
+                            # Explanation batches get their own, smaller completion limit
+                            st.session_state.explain_llm = get_llm(
+                                groq_api_key, model_name, max_tokens=explanation_budget()
+                            )
+                            st.session_state.current_model = model_name
+                            if questions_first:
+                                # Phase 2: explanations stream in while the questions are shown
+                                st.session_state.explain_future = start_explanations(
+                                    st.session_state.explain_llm, quiz
+                                )
+                            else:
+                                st.session_state.pop("explain_future", None)
+                            st.session_state.current_topic = topic
+                            st.session_state.current_level = level
+                            st.session_state.current_num = num_questions
+                        
+                            st.success(Config.MESSAGES["mcq_success"])
+                            st.balloons()
                     
                 except Exception as e:
-                    st.error(f"❌ Error generating MCQs: {str(e)}")
-                    st.info("💡 Make sure your GROQ_API_KEY is set correctly")
-                    if "API" in str(e).upper():
-                        st.warning("🔑 Check your Groq API key in the .env file")
+                    if is_retryable(e):
+                        st.error("🚦 The AI service is busy right now. Please try again in a minute.")
+                    else:
+                        st.error(f"❌ Error generating MCQs: {str(e)}")
+                        st.info("💡 Make sure your GROQ_API_KEY is set correctly")
+                        if "API" in str(e).upper():
+                            st.warning("🔑 Check your Groq API key in the .env file")
+
+# ----------------------------
+# LAZY EXPLANATIONS
+# ----------------------------
+def publish_explanations():
+    """Show explanations that have arrived and persist a completed set."""
+    quiz = st.session_state.quiz
+    text = quiz.to_text()
+    st.session_state.mcqs = text
+    st.session_state.pop("mcq_display", None)
+    st.session_state.pop("pdf_bytes", None)
+    if quiz.missing_explanations():
+        return
+    if (Config.CACHE["enabled"] and st.session_state.get("full_cache_key")
+            and cacheable(quiz, st.session_state.get("current_num", len(quiz)))):
+        get_cache().put(st.session_state.full_cache_key, text)
+    if Config.BANK["enabled"]:
+        save_questions(quiz, st.session_state.get("current_model"))
+    if st.session_state.get("session_id"):
+        update_session_quiz(st.session_state.session_id, text, quiz)
+
+def record_explanation_tokens(tokens):
+    """Charge explanation follow-ups to the user without counting a generation."""
+    if tokens:
+        record_generation(st.session_state.user, tokens, 0.0, generations=0)
+
+def load_explanations(indices=None):
+    """Block until the given explanations (all by default) are present."""
+    future = st.session_state.pop("explain_future", None)
+    if future is not None:
+        try:
+            record_explanation_tokens(future.result())
+        except Exception:
+            pass  # anything still missing is requested again below
+    llm = st.session_state.get("explain_llm") or get_llm(
+        os.getenv("GROQ_API_KEY"), st.session_state.get("current_model"), max_tokens=explanation_budget()
+    )
+    record_explanation_tokens(explain_questions(llm, st.session_state.quiz, indices))
+    publish_explanations()
+
+@st.fragment(run_every=2)
+def explanation_status():
+    future = st.session_state.get("explain_future")
+    if future is None:
+        return
+    if future.done():
+        st.rerun()
+    quiz = st.session_state.quiz
+    ready = len(quiz) - len(quiz.missing_explanations())
+    st.info(f"💡 Writing explanations in the background... {ready}/{len(quiz)} ready")
 
 # ----------------------------
 # DISPLAY & MANAGE MCQs
@@ -292,6 +672,16 @@ if "mcqs" in st.session_state and st.session_state.mcqs:
     st.markdown("---")
     st.markdown("### 📝 Generated MCQs")
     
+    # Background explanation batch finished since the last rerun
+    explain_future = st.session_state.get("explain_future")
+    if explain_future is not None and explain_future.done():
+        st.session_state.pop("explain_future")
+        if explain_future.exception() is not None:
+            st.warning("⚠️ Some explanations could not be loaded. Use the buttons below to retry.")
+        else:
+            record_explanation_tokens(explain_future.result())
+        publish_explanations()
+    
     # Display metadata if available
     if "current_topic" in st.session_state:
         col1, col2, col3, col4 = st.columns(4)
@@ -308,6 +698,24 @@ if "mcqs" in st.session_state and st.session_state.mcqs:
             else:
                 st.markdown("**✨ Status:** Newly generated")
     
+    missing = st.session_state.quiz.missing_explanations() if st.session_state.get("quiz") else []
+    if missing:
+        explanation_status()
+        col1, col2 = st.columns(2)
+        with col1:
+            number = st.selectbox("💡 Question to explain", [i + 1 for i in missing], key="explain_pick")
+            explain_one = st.button("💡 Explain this question", use_container_width=True)
+        with col2:
+            st.caption(f"{len(missing)} question(s) still without an explanation")
+            explain_all = st.button("💡 Load all explanations", use_container_width=True)
+        if explain_one or explain_all:
+            try:
+                with st.spinner("💡 Writing explanations..."):
+                    load_explanations([number - 1] if explain_one else None)
+                st.rerun()
+            except Exception as e:
+                st.error(f"❌ Error loading explanations: {str(e)}")
+    
     # Display MCQs in a nice container
     st.markdown("#### Your MCQ Set:")
     st.text_area(
@@ -322,35 +730,59 @@ if "mcqs" in st.session_state and st.session_state.mcqs:
     col1, col2, col3 = st.columns(3)
     
     with col1:
+        topic_to_save = st.session_state.get('current_topic', st.session_state.get('loaded_topic', 'Untitled'))
         if st.button("📄 Save as PDF", use_container_width=True, type="primary"):
             try:
                 with st.spinner("📄 Creating PDF..."):
-                    topic_to_save = st.session_state.get('current_topic', st.session_state.get('loaded_topic', 'Untitled'))
-                    pdf_path = save_pdf(
-                        st.session_state.mcqs, 
+                    # The PDF always carries explanations; fetch any still missing
+                    if st.session_state.quiz.missing_explanations():
+                        load_explanations()
+                    pdf_bytes = render_pdf(
+                        st.session_state.quiz, 
                         topic=topic_to_save,
                         user_email=st.session_state.user
                     )
+                    pdf_path = None
+                    if Config.STORAGE["persist_pdfs"]:
+                        pdf_path = persist_pdf(pdf_bytes, st.session_state.quiz, topic_to_save)
                     
                     # Save to history
-                    save_history(
+                    st.session_state.session_id = save_history(
                         st.session_state.user,
                         topic_to_save,
                         st.session_state.mcqs,
-                        pdf_path
+                        pdf_path,
+                        quiz=st.session_state.quiz
                     )
                     
-                    st.success(f"✅ PDF saved successfully!")
-                    st.info(f"📍 Location: {pdf_path}")
+                    st.session_state.pdf_bytes = pdf_bytes
+                    st.session_state.pop("history_rows", None)
+                    st.success(Config.MESSAGES["pdf_success"])
                     
             except Exception as e:
                 st.error(f"❌ Error saving PDF: {str(e)}")
+        
+        if st.session_state.get("pdf_bytes"):
+            st.download_button(
+                "⬇️ Download PDF",
+                data=st.session_state.pdf_bytes,
+                file_name=content_address(st.session_state.quiz, topic_to_save),
+                mime="application/pdf",
+                use_container_width=True
+            )
     
     with col2:
         if st.button("🔄 Generate New Set", use_container_width=True):
             # Clear current MCQs to force new generation
             if "mcqs" in st.session_state:
                 del st.session_state.mcqs
+            if "quiz" in st.session_state:
+                del st.session_state.quiz
+            if "pdf_bytes" in st.session_state:
+                del st.session_state.pdf_bytes
+            st.session_state.pop("exam_pack", None)
+            st.session_state.pop("explain_future", None)
+            st.session_state.pop("session_id", None)
             if "current_topic" in st.session_state:
                 del st.session_state.current_topic
             if "loaded_topic" in st.session_state:
@@ -364,6 +796,53 @@ if "mcqs" in st.session_state and st.session_state.mcqs:
             📋 Copy to Clipboard
         </button>
         """, unsafe_allow_html=True)
+    
+    # Shuffled versions of the same exam, built locally without the AI
+    with st.expander("🔀 Exam Versions (anti-copying)"):
+        col1, col2 = st.columns(2)
+        with col1:
+            num_versions = st.number_input(
+                "Number of versions",
+                min_value=Config.EXAMS["min_versions"],
+                max_value=Config.EXAMS["max_versions"],
+                value=Config.EXAMS["default_versions"]
+            )
+        with col2:
+            exam_seed = st.text_input(
+                "Shuffle seed",
+                value="",
+                help="Reuse a seed to reproduce the same papers; leave blank for a new shuffle"
+            )
+        shuffle_order = st.checkbox("Shuffle question order", value=True)
+        
+        if st.button("🔀 Create Exam Versions", use_container_width=True):
+            try:
+                with st.spinner("🔀 Shuffling and rendering versions..."):
+                    variants = make_variants(
+                        st.session_state.quiz,
+                        int(num_versions),
+                        seed=exam_seed.strip() or None,
+                        shuffle_questions=shuffle_order
+                    )
+                    st.session_state.exam_pack = render_exam_pack(
+                        variants, topic=topic_to_save, user_email=st.session_state.user
+                    )
+                    st.session_state.exam_seed = variants[0].seed
+                st.success(
+                    f"✅ {len(variants)} versions and a combined answer key are ready "
+                    f"(seed {st.session_state.exam_seed})"
+                )
+            except Exception as e:
+                st.error(f"❌ Error creating exam versions: {str(e)}")
+        
+        if st.session_state.get("exam_pack"):
+            st.download_button(
+                "⬇️ Download Exam Pack (.zip)",
+                data=st.session_state.exam_pack,
+                file_name=f"exam_versions_{''.join(c for c in str(st.session_state.exam_seed) if c.isalnum())}.zip",
+                mime="application/zip",
+                use_container_width=True
+            )
 
 # ----------------------------
 # PROFESSIONAL FOOTER
@@ -1,16 +1,16 @@
 import sqlite3
 import hashlib
+import json
+import random
 
-DB_NAME = "users.db"
+from config import Config
+from db import get_pool
+from cache import normalize_topic
+from quiz import Question, WORD_RE
+from metrics import timed, increment
 
-def get_db():
-    return sqlite3.connect(DB_NAME)
-
-def create_tables():
-    conn = get_db()
-    c = conn.cursor()
-
-    c.execute("""
+def _schema_v1(conn):
+    conn.execute("""
     CREATE TABLE IF NOT EXISTS users (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         email TEXT UNIQUE,
@@ -18,83 +18,481 @@ def create_tables():
     )
     """)
 
-    c.execute("""
+    conn.execute("""
     CREATE TABLE IF NOT EXISTS history (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         email TEXT,
         topic TEXT,
         mcq_text TEXT,
         pdf_path TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        mcq_json TEXT
+    )
+    """)
+
+    # Older databases predate the structured quiz column
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(history)")]
+    if "mcq_json" not in columns:
+        conn.execute("ALTER TABLE history ADD COLUMN mcq_json TEXT")
+
+def _schema_v2(conn):
+    # Sidebar listing: newest-first per user, with id as a tie-breaker
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_history_email_created "
+        "ON history (email, created_at DESC, id DESC)"
+    )
+    # Sidebar search: case-insensitive topic prefix match per user
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_history_email_topic "
+        "ON history (email, topic COLLATE NOCASE)"
+    )
+
+def _schema_v3(conn):
+    # Per-user aggregates kept current on every save/generation
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS user_stats (
+        email TEXT PRIMARY KEY,
+        sessions INTEGER NOT NULL DEFAULT 0,
+        questions INTEGER NOT NULL DEFAULT 0,
+        easy_sets INTEGER NOT NULL DEFAULT 0,
+        medium_sets INTEGER NOT NULL DEFAULT 0,
+        hard_sets INTEGER NOT NULL DEFAULT 0,
+        generations INTEGER NOT NULL DEFAULT 0,
+        tokens INTEGER NOT NULL DEFAULT 0,
+        latency_total REAL NOT NULL DEFAULT 0
+    )
+    """)
+
+    # Backfill from existing history; rows without structured data count as sessions only
+    conn.execute("""
+    INSERT OR IGNORE INTO user_stats (email, sessions, questions, easy_sets, medium_sets, hard_sets)
+    SELECT
+        email,
+        COUNT(*),
+        COALESCE(SUM(json_array_length(mcq_json, '$.questions')), 0),
+        SUM(json_extract(mcq_json, '$.level') = 'Easy'),
+        SUM(json_extract(mcq_json, '$.level') = 'Medium'),
+        SUM(json_extract(mcq_json, '$.level') = 'Hard')
+    FROM history
+    GROUP BY email
+    """)
+
+def _schema_v4(conn):
+    # Per-model latency/cost aggregates that drive model routing
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS model_stats (
+        model TEXT PRIMARY KEY,
+        generations INTEGER NOT NULL DEFAULT 0,
+        questions INTEGER NOT NULL DEFAULT 0,
+        tokens INTEGER NOT NULL DEFAULT 0,
+        latency_total REAL NOT NULL DEFAULT 0
+    )
+    """)
+
+def _schema_v5(conn):
+    # Question bank: every complete generated question, reusable across requests
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS questions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        topic TEXT NOT NULL,
+        topic_key TEXT NOT NULL,
+        level TEXT NOT NULL,
+        stem TEXT NOT NULL,
+        stem_key TEXT NOT NULL,
+        options TEXT NOT NULL,
+        answer TEXT NOT NULL,
+        explanation TEXT NOT NULL DEFAULT '',
+        model TEXT,
+        source TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (topic_key, level, stem_key)
+    )
+    """)
+    # Full-text index over topic and stem, kept in sync by triggers
+    conn.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts USING fts5(
+        topic, stem, content='questions', content_rowid='id', tokenize='porter unicode61'
+    )
+    """)
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS questions_ai AFTER INSERT ON questions BEGIN
+        INSERT INTO questions_fts (rowid, topic, stem) VALUES (new.id, new.topic, new.stem);
+    END
+    """)
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS questions_ad AFTER DELETE ON questions BEGIN
+        INSERT INTO questions_fts (questions_fts, rowid, topic, stem)
+        VALUES ('delete', old.id, old.topic, old.stem);
+    END
+    """)
+
+    # Backfill from saved sessions that carry structured quizzes
+    rows = conn.execute(
+        "SELECT mcq_json FROM history WHERE mcq_json IS NOT NULL"
+    ).fetchall()
+    for (raw,) in rows:
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            continue
+        _insert_questions(
+            conn, data.get("topic", ""), data.get("level", ""),
+            [Question.from_dict(q) for q in data.get("questions", [])], None, "history"
+        )
+
+def _schema_v6(conn):
+    # The v3 backfill drops users whose history is all legacy rows (mcq_json
+    # IS NULL): their level SUMs are NULL. Recompute the history-derived
+    # columns for everyone, with COALESCEs, keeping generation/token totals.
+    conn.execute("""
+    INSERT INTO user_stats (email, sessions, questions, easy_sets, medium_sets, hard_sets)
+    SELECT
+        email,
+        COUNT(*),
+        COALESCE(SUM(json_array_length(mcq_json, '$.questions')), 0),
+        COALESCE(SUM(json_extract(mcq_json, '$.level') = 'Easy'), 0),
+        COALESCE(SUM(json_extract(mcq_json, '$.level') = 'Medium'), 0),
+        COALESCE(SUM(json_extract(mcq_json, '$.level') = 'Hard'), 0)
+    FROM history
+    WHERE true
+    GROUP BY email
+    ON CONFLICT(email) DO UPDATE SET
+        sessions = excluded.sessions,
+        questions = excluded.questions,
+        easy_sets = excluded.easy_sets,
+        medium_sets = excluded.medium_sets,
+        hard_sets = excluded.hard_sets
+    """)
+
+def _schema_v7(conn):
+    # Flushed stage latencies for the admin dashboard's history view
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS metrics_samples (
+        stage TEXT,
+        recorded_at REAL,
+        seconds REAL
+    )
+    """)
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_metrics_samples_time ON metrics_samples (recorded_at)"
+    )
+
+def _schema_v8(conn):
+    # Per-model latency by request size, so routing compares like with like
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS model_size_stats (
+        model TEXT NOT NULL,
+        size_bucket INTEGER NOT NULL,
+        generations INTEGER NOT NULL DEFAULT 0,
+        latency_total REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (model, size_bucket)
+    )
+    """)
+
+def _schema_v9(conn):
+    # Question stems each user has been shown, with MinHash signatures for dedup
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS seen_questions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        email TEXT NOT NULL,
+        topic_key TEXT NOT NULL,
+        stem TEXT NOT NULL,
+        signature BLOB NOT NULL,
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     )
     """)
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_seen_questions_email_topic "
+        "ON seen_questions (email, topic_key, id DESC)"
+    )
 
-    conn.commit()
-    conn.close()
+# Applied in order, once per database; append new steps, never edit old ones
+MIGRATIONS = [
+    _schema_v1,
+    _schema_v2,
+    _schema_v3,
+    _schema_v4,
+    _schema_v5,
+    _schema_v6,
+    _schema_v7,
+    _schema_v8,
+    _schema_v9,
+]
+
+SESSION_PAGE_SIZE = 20
+
+def get_db():
+    return get_pool().connection()
+
+def create_tables():
+    get_pool().migrate(MIGRATIONS)
 
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
 
+@timed("db_signup")
 def signup(email, password):
-    conn = get_db()
-    c = conn.cursor()
     try:
-        c.execute(
-            "INSERT INTO users (email, password) VALUES (?, ?)",
-            (email, hash_password(password))
-        )
-        conn.commit()
+        with get_db() as conn:
+            conn.execute(
+                "INSERT INTO users (email, password) VALUES (?, ?)",
+                (email, hash_password(password))
+            )
         return True
     except sqlite3.IntegrityError:
         return False
-    finally:
-        conn.close()
 
+@timed("db_login")
 def login(email, password):
-    conn = get_db()
-    c = conn.cursor()
-    c.execute(
-        "SELECT id FROM users WHERE email=? AND password=?",
-        (email, hash_password(password))
-    )
-    row = c.fetchone()
-    conn.close()
+    with get_db() as conn:
+        row = conn.execute(
+            "SELECT id FROM users WHERE email=? AND password=?",
+            (email, hash_password(password))
+        ).fetchone()
     return row is not None
 
-def save_history(email, topic, mcq_text, pdf_path):
-    conn = get_db()
-    c = conn.cursor()
-    c.execute(
-        "INSERT INTO history (email, topic, mcq_text, pdf_path) VALUES (?, ?, ?, ?)",
-        (email, topic, mcq_text, pdf_path)
-    )
-    conn.commit()
-    conn.close()
-
-def get_sessions(email):
-    conn = get_db()
-    c = conn.cursor()
-    c.execute(
-        "SELECT id, topic, created_at FROM history WHERE email=? ORDER BY created_at DESC",
-        (email,)
-    )
-    rows = c.fetchall()
-    conn.close()
-    return rows
+@timed("db_save_history")
+def save_history(email, topic, mcq_text, pdf_path, quiz=None):
+    """Store a session and return its history id."""
+    num_questions = len(quiz) if quiz is not None else 0
+    level = quiz.level if quiz is not None else ""
+    with get_db() as conn:
+        session_id = conn.execute(
+            "INSERT INTO history (email, topic, mcq_text, pdf_path, mcq_json) VALUES (?, ?, ?, ?, ?)",
+            (email, topic, mcq_text, pdf_path, quiz.to_json() if quiz is not None else None)
+        ).lastrowid
+        conn.execute(
+            """
+            INSERT INTO user_stats (email, sessions, questions, easy_sets, medium_sets, hard_sets)
+            VALUES (?, 1, ?, ?, ?, ?)
+            ON CONFLICT(email) DO UPDATE SET
+                sessions = sessions + 1,
+                questions = questions + excluded.questions,
+                easy_sets = easy_sets + excluded.easy_sets,
+                medium_sets = medium_sets + excluded.medium_sets,
+                hard_sets = hard_sets + excluded.hard_sets
+            """,
+            (email, num_questions, int(level == "Easy"), int(level == "Medium"), int(level == "Hard"))
+        )
+    return session_id
 
-def get_session_data(session_id):
-    conn = get_db()
-    c = conn.cursor()
-    c.execute(
-        "SELECT topic, mcq_text FROM history WHERE id=?",
-        (session_id,)
-    )
-    row = c.fetchone()
-    conn.close()
-    return row
+@timed("db_update_session_quiz")
+def update_session_quiz(session_id, mcq_text, quiz):
+    """Replace a stored session's content, e.g. once lazy explanations arrive."""
+    with get_db() as conn:
+        conn.execute(
+            "UPDATE history SET mcq_text=?, mcq_json=? WHERE id=?",
+            (mcq_text, quiz.to_json(), session_id)
+        )
 
+@timed("db_record_generation")
+def record_generation(email, tokens, latency, generations=1):
+    """Add one LLM generation's completion tokens and latency (seconds).
 
+    Follow-up work for an earlier generation, such as its explanations,
+    passes ``generations=0`` so only the tokens are added.
+    """
+    with get_db() as conn:
+        conn.execute(
+            """
+            INSERT INTO user_stats (email, generations, tokens, latency_total)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(email) DO UPDATE SET
+                generations = generations + excluded.generations,
+                tokens = tokens + excluded.tokens,
+                latency_total = latency_total + excluded.latency_total
+            """,
+            (email, generations, int(tokens or 0), float(latency))
+        )
+
+def size_bucket(num_questions):
+    """Smallest power of two holding ``num_questions``: 1, 2, 4, 8, 16, ..."""
+    return 1 << max(0, int(num_questions) - 1).bit_length()
+
+@timed("db_record_model_usage")
+def record_model_usage(model, num_questions, tokens, latency):
+    """Add one generation to the model's routing statistics."""
+    with get_db() as conn:
+        conn.execute(
+            """
+            INSERT INTO model_stats (model, generations, questions, tokens, latency_total)
+            VALUES (?, 1, ?, ?, ?)
+            ON CONFLICT(model) DO UPDATE SET
+                generations = generations + 1,
+                questions = questions + excluded.questions,
+                tokens = tokens + excluded.tokens,
+                latency_total = latency_total + excluded.latency_total
+            """,
+            (model, int(num_questions), int(tokens or 0), float(latency))
+        )
+        conn.execute(
+            """
+            INSERT INTO model_size_stats (model, size_bucket, generations, latency_total)
+            VALUES (?, ?, 1, ?)
+            ON CONFLICT(model, size_bucket) DO UPDATE SET
+                generations = generations + 1,
+                latency_total = latency_total + excluded.latency_total
+            """,
+            (model, size_bucket(num_questions), float(latency))
+        )
+
+@timed("db_get_model_stats")
+def get_model_stats(num_questions=None):
+    """Per-model generations, average latency and seconds per question.
+
+    With ``num_questions`` each entry also carries ``bucket_generations``
+    and ``bucket_avg_latency`` for requests of that size bucket.
+    """
+    with get_db() as conn:
+        rows = conn.execute(
+            "SELECT model, generations, questions, tokens, latency_total FROM model_stats"
+        ).fetchall()
+        buckets = {}
+        if num_questions is not None:
+            buckets = {
+                model: (generations, latency_total)
+                for model, generations, latency_total in conn.execute(
+                    "SELECT model, generations, latency_total FROM model_size_stats WHERE size_bucket=?",
+                    (size_bucket(num_questions),)
+                )
+            }
+    stats = {}
+    for model, generations, questions, tokens, latency_total in rows:
+        stats[model] = {
+            "generations": generations,
+            "questions": questions,
+            "tokens": tokens,
+            "avg_latency": latency_total / generations if generations else 0.0,
+            "sec_per_question": latency_total / questions if questions else 0.0,
+        }
+        if num_questions is not None:
+            bucket_generations, bucket_latency = buckets.get(model, (0, 0.0))
+            stats[model]["bucket_generations"] = bucket_generations
+            stats[model]["bucket_avg_latency"] = (
+                bucket_latency / bucket_generations if bucket_generations else 0.0
+            )
+    return stats
+
+def _stem_key(stem):
+    return " ".join(WORD_RE.findall(stem.lower()))
+
+def _insert_questions(conn, topic, level, questions, model, source):
+    rows = [
+        (
+            topic, normalize_topic(topic), level, q.stem, _stem_key(q.stem),
+            json.dumps(q.options, ensure_ascii=False), q.answer, q.explanation, model, source
+        )
+        for q in questions
+        if topic.strip() and level and not q.problems()
+    ]
+    return conn.executemany(
+        "INSERT OR IGNORE INTO questions "
+        "(topic, topic_key, level, stem, stem_key, options, answer, explanation, model, source) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        rows
+    ).rowcount
+
+@timed("db_save_questions")
+def save_questions(quiz, model=None, source="app"):
+    """Add a quiz's complete questions to the bank; returns how many were new.
+
+    Questions without an explanation (or otherwise malformed) are skipped,
+    so a questions-first set is banked once its explanations arrive.
+    """
+    with get_db() as conn:
+        return _insert_questions(conn, quiz.topic, quiz.level, quiz.questions, model, source)
+
+def bank_query(topic):
+    """FTS5 expression requiring every topic word in the topic or stem."""
+    words = WORD_RE.findall(topic.lower())
+    if not words:
+        return None
+    return "{topic stem} : (" + " ".join(f'"{w}"' for w in words) + ")"
+
+@timed("db_find_questions")
+def find_questions(topic, level, limit, exclude=None):
+    """Up to ``limit`` banked questions for the topic and level.
 
+    Exact topic matches come first, then full-text matches ranked by BM25
+    (topic words weigh more than stem words). A wider pool is sampled so
+    repeated requests do not always get the same questions. Stems for which
+    ``exclude(stem)`` is truthy are skipped before sampling.
+    """
+    query = bank_query(topic)
+    if query is None or limit <= 0:
+        return []
+    pool_size = limit * Config.BANK["candidate_factor"]
+    with get_db() as conn:
+        rows = conn.execute(
+            """
+            SELECT q.stem, q.options, q.answer, q.explanation
+            FROM questions_fts f JOIN questions q ON q.id = f.rowid
+            WHERE questions_fts MATCH ? AND q.level = ?
+            ORDER BY q.topic_key = ? DESC, bm25(questions_fts, 10.0, 1.0)
+            LIMIT ?
+            """,
+            (query, level, normalize_topic(topic), pool_size)
+        ).fetchall()
+    if exclude is not None:
+        rows = [row for row in rows if not exclude(row[0])]
+    rows = random.sample(rows, min(limit, len(rows)))
+    increment("bank_questions_served_total", len(rows))
+    return [
+        Question(number, stem, json.loads(options), answer, explanation)
+        for number, (stem, options, answer, explanation) in enumerate(rows, start=1)
+    ]
 
+@timed("db_count_questions")
+def count_questions():
+    with get_db() as conn:
+        return conn.execute("SELECT COUNT(*) FROM questions").fetchone()[0]
 
+@timed("db_get_user_stats")
+def get_user_stats(email):
+    """Read a user's aggregates with a single primary-key lookup."""
+    with get_db() as conn:
+        row = conn.execute(
+            "SELECT sessions, questions, easy_sets, medium_sets, hard_sets, "
+            "generations, tokens, latency_total FROM user_stats WHERE email=?",
+            (email,)
+        ).fetchone()
+    sessions, questions, easy, medium, hard, generations, tokens, latency_total = row or (0,) * 8
+    return {
+        "sessions": sessions,
+        "questions": questions,
+        "levels": {"Easy": easy, "Medium": medium, "Hard": hard},
+        "generations": generations,
+        "tokens": tokens,
+        "avg_latency": latency_total / generations if generations else 0.0,
+    }
 
+@timed("db_get_sessions")
+def get_sessions(email, limit=SESSION_PAGE_SIZE, before=None, search=None):
+    """Return one page of a user's sessions, newest first.
+
+    ``before`` is the ``(created_at, id)`` of the last row already shown, so
+    each "load more" seeks straight into the index instead of using OFFSET.
+    ``search`` filters to topics starting with the given text.
+    """
+    query = "SELECT id, topic, created_at FROM history WHERE email=?"
+    params = [email]
+    if search:
+        escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        query += " AND topic LIKE ? ESCAPE '\\'"
+        params.append(escaped + "%")
+    if before is not None:
+        query += " AND (created_at, id) < (?, ?)"
+        params.extend(before)
+    query += " ORDER BY created_at DESC, id DESC LIMIT ?"
+    params.append(limit)
+
+    with get_db() as conn:
+        return conn.execute(query, params).fetchall()
+
+@timed("db_get_session_data")
+def get_session_data(session_id):
+    with get_db() as conn:
+        return conn.execute(
+            "SELECT topic, mcq_text, mcq_json FROM history WHERE id=?",
+            (session_id,)
+        ).fetchone()
@@ -0,0 +1,457 @@
+"""
+EduQuiz Pro Benchmarks
+Offline performance checks that need no Groq API key.
+
+Usage:
+    python benchmark.py parse
+    python benchmark.py pdf
+    python benchmark.py db
+    python benchmark.py rerun
+    python benchmark.py format
+    python benchmark.py hedge --slow-rate 0.05
+    python benchmark.py dedup
+    python benchmark.py variants
+    python benchmark.py batch
+    python benchmark.py e2e --ttft 0.2 --tps 500 --failure-rate 0.05
+"""
+
+import argparse
+import os
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+from llm_backend import sample_mcq_json, sample_mcq_text
+from quiz import QuizSet, parse_quiz, parse_quiz_json
+
+SIZES = (20, 100, 1000)
+PDF_SIZES = (20, 100, 500)
+
+
+def timed(func, repeat):
+    """Run ``func`` ``repeat`` times and return the per-run timings in ms."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def report(label, timings):
+    print(f"  {label:<32} median {statistics.median(timings):9.2f} ms   "
+          f"min {min(timings):9.2f} ms")
+
+
+def percentiles(timings):
+    """p50/p95/p99 of a list of timings (falls back to max for tiny samples)."""
+    if len(timings) < 2:
+        return timings[0], timings[0], timings[0]
+    cuts = statistics.quantiles(timings, n=100, method="inclusive")
+    return cuts[49], cuts[94], cuts[98]
+
+
+def bench_parse(repeat):
+    """Compare re-parsing free text against loading the stored JSON model."""
+    from pdf_generator import save_pdf
+
+    for size in SIZES:
+        text = sample_mcq_text(size)
+        stored = parse_quiz(text, topic="Cell Biology").to_json()
+        runs = repeat if size < 1000 else max(1, repeat // 5)
+        print(f"\n{size} questions ({runs} runs)")
+
+        report("parse text", timed(lambda: parse_quiz(text), runs))
+        report("load JSON", timed(lambda: QuizSet.from_json(stored), runs))
+
+        paths = []
+        report("render from text", timed(
+            lambda: paths.append(save_pdf(text, filename=f"bench_text_{size}.pdf")), runs))
+        report("load JSON + render model", timed(
+            lambda: paths.append(save_pdf(QuizSet.from_json(stored), filename=f"bench_model_{size}.pdf")),
+            runs))
+        for path in set(paths):
+            os.remove(path)
+
+
+def bench_pdf(repeat):
+    """Report per-question render cost so large exam books stay bounded."""
+    from pdf_generator import save_pdf
+
+    print(f"{'questions':>10} {'source':>8} {'median ms':>11} {'ms/question':>12}")
+    for size in PDF_SIZES:
+        text = sample_mcq_text(size)
+        quiz = parse_quiz(text, topic="Cell Biology")
+        runs = repeat if size < 500 else max(1, repeat // 5)
+        for source, content in (("text", text), ("model", quiz)):
+            filename = f"bench_pdf_{source}_{size}.pdf"
+            timings = timed(lambda: save_pdf(content, filename=filename), runs)
+            median = statistics.median(timings)
+            print(f"{size:>10} {source:>8} {median:>11.1f} {median / size:>12.3f}")
+            os.remove(os.path.join("outputs", filename))
+
+
+def bench_format(repeat):
+    """Token cost and parse time of the text template vs compact JSON mode."""
+    from prompt import build_json_prompt, build_prompt
+
+    # ~4 characters per token, the same estimate the rate limiter uses
+    def tokens(text):
+        return len(text) // 4
+
+    print(f"{'questions':>10} {'format':>7} {'prompt tok':>11} {'output tok':>11} {'parse ms':>9}")
+    for size in SIZES:
+        runs = repeat if size < 1000 else max(1, repeat // 5)
+        for name, prompt, output, parse in (
+            ("text", build_prompt("Cell Biology", size, "Medium"), sample_mcq_text(size), parse_quiz),
+            ("json", build_json_prompt("Cell Biology", size, "Medium"), sample_mcq_json(size), parse_quiz_json),
+        ):
+            median = statistics.median(timed(lambda: parse(output), runs))
+            print(f"{size:>10} {name:>7} {tokens(prompt):>11} {tokens(output):>11} {median:>9.2f}")
+
+
+def bench_hedge(repeat):
+    """Tail latency of a single model vs a hedged primary/fallback pair (mock)."""
+    import asyncio
+
+    from config import Config
+    from llm_backend import HedgedLLM, MockLLM
+    from rate_limiter import RateLimiter, set_limiter
+
+    # Hedged requests take limiter slots; measure latency, not the Groq budget
+    set_limiter(RateLimiter(10 ** 6, 10 ** 9))
+    calls = repeat * 20
+    options = {**Config.MOCK_LLM, "slow_rate": Config.MOCK_LLM["slow_rate"] or 0.05}
+    prompt = "Create EXACTLY 5 questions"
+
+    async def measure(llm):
+        async def one():
+            started = time.perf_counter()
+            response = await llm.ainvoke(prompt)
+            return (time.perf_counter() - started) * 1000, response.response_metadata.get("route", "primary")
+        return await asyncio.gather(*(one() for _ in range(calls)))
+
+    print(f"{calls} calls, slow_rate {options['slow_rate']}, slow_ttft {options['slow_ttft']}s, "
+          f"hedge after {Config.AI_CONFIG['hedge_after']}s")
+    print(f"  {'setup':<10} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10}  routes")
+    for name in ("single", "hedged"):
+        primary = MockLLM(model_name="primary", **options)
+        llm = primary if name == "single" else HedgedLLM(
+            primary, MockLLM(model_name="fallback", **options), hedge_after=Config.AI_CONFIG["hedge_after"]
+        )
+        results = asyncio.run(measure(llm))
+        p50, p95, p99 = percentiles([ms for ms, _ in results])
+        routes = {}
+        for _, route in results:
+            routes[route] = routes.get(route, 0) + 1
+        print(f"  {name:<10} {p50:>10.1f} {p95:>10.1f} {p99:>10.1f}  {routes}")
+
+
+def bench_variants(repeat):
+    """Shuffle and render N exam versions of one quiz, all locally."""
+    from pdf_generator import render_exam_pack
+    from variants import make_variants
+
+    print(f"{'questions':>10} {'versions':>9} {'shuffle ms':>11} {'pack ms':>9}")
+    for size in (20, 100):
+        quiz = parse_quiz(sample_mcq_text(size), topic="Cell Biology", level="Medium")
+        for count in (4, 10):
+            shuffle = statistics.median(timed(lambda: make_variants(quiz, count, seed=1), repeat))
+            variants = make_variants(quiz, count, seed=1)
+            runs = max(1, repeat // 5)
+            pack = statistics.median(timed(lambda: render_exam_pack(variants, topic="Cell Biology"), runs))
+            print(f"{size:>10} {count:>9} {shuffle:>11.2f} {pack:>9.1f}")
+
+
+def bench_batch(repeat):
+    """Many-quiz export: one-by-one rendering vs the process pool, and an exam book."""
+    from config import Config
+    from pdf_generator import get_render_pool, render_batch, render_exam_book, render_pdf
+
+    workers = Config.PDF_RENDER["max_workers"] or os.cpu_count()
+    print(f"{workers} render worker(s); 20 questions per quiz")
+    get_render_pool().submit(int).result()  # start the pool outside the timings
+    runs = max(1, repeat // 5)
+    for count in (8, 32):
+        quizzes = [
+            parse_quiz(sample_mcq_text(20, f"Topic {i}"), topic=f"Topic {i}", level="Medium")
+            for i in range(count)
+        ]
+        print(f"\n{count} quizzes ({runs} runs)")
+        report("sequential render_pdf", timed(lambda: [render_pdf(q, topic=q.topic) for q in quizzes], runs))
+        report("render_batch (process pool)", timed(lambda: render_batch(quizzes), runs))
+        report("exam book (one PDF + contents)", timed(lambda: render_exam_book(quizzes), runs))
+
+
+DEDUP_SIZE = 100_000
+
+
+def _synthetic_stems(count, seed=0):
+    """Distinct question-like stems built from a fixed random vocabulary."""
+    import random
+
+    rng = random.Random(seed)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    vocabulary = ["".join(rng.choice(letters) for _ in range(rng.randint(4, 9))) for _ in range(3000)]
+    openers = ("What is", "Which of the following", "Why does", "How does", "When is")
+    return [
+        f"{rng.choice(openers)} {' '.join(rng.choice(vocabulary) for _ in range(rng.randint(6, 11)))}?"
+        for _ in range(count)
+    ]
+
+
+def bench_dedup(repeat):
+    """Near-duplicate lookup at 100k stored stems: MinHash/LSH vs a linear scan."""
+    import random
+
+    from dedup import StemIndex, shingles, signature
+
+    stems = _synthetic_stems(DEDUP_SIZE)
+    started = time.perf_counter()
+    signatures = [signature(stem) for stem in stems]
+    sign_seconds = time.perf_counter() - started
+    index = StemIndex()
+    started = time.perf_counter()
+    for stem, sig in zip(stems, signatures):
+        index.add(stem, sig)
+    add_seconds = time.perf_counter() - started
+    print(f"{len(index):,} stems: signatures {sign_seconds:.1f}s "
+          f"({sign_seconds / len(stems) * 1e6:.0f} us each), index build {add_seconds:.1f}s")
+
+    # Near-duplicates change one word of a stored stem; fresh stems come from a new seed
+    rng = random.Random(1)
+    queries = repeat * 20
+    near = []
+    for stem in rng.sample(stems, queries):
+        words = stem.split()
+        words[rng.randrange(2, len(words))] = "altered"
+        near.append(" ".join(words))
+    fresh = _synthetic_stems(queries, seed=2)
+
+    lsh_near = timed(lambda: [index.match(q) for q in near], 1)[0] / queries
+    lsh_fresh = timed(lambda: [index.match(q) for q in fresh], 1)[0] / queries
+    found = sum(index.match(q) is not None for q in near)
+    false = sum(index.match(q) is not None for q in fresh)
+
+    sets = [shingles(stem) for stem in stems]
+
+    def scan(query):
+        words = shingles(query)
+        return max(len(words & other) / len(words | other) for other in sets)
+
+    scan_runs = max(1, repeat // 5)
+    scan_ms = statistics.median(timed(lambda: scan(near[0]), scan_runs))
+    print(f"  {'LSH lookup (near-duplicate)':<32} {lsh_near:9.3f} ms/query   recall {found / queries:.0%}")
+    print(f"  {'LSH lookup (new stem)':<32} {lsh_fresh:9.3f} ms/query   false matches {false}")
+    print(f"  {'linear Jaccard scan':<32} {scan_ms:9.1f} ms/query")
+
+
+def _run_writers(write, writers, ops):
+    """Run ``ops`` calls of ``write`` on each of ``writers`` threads; return ops/sec."""
+    errors = []
+
+    def worker(worker_id):
+        for i in range(ops):
+            try:
+                write(worker_id, i)
+            except sqlite3.OperationalError as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(w,)) for w in range(writers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return (writers * ops - len(errors)) / elapsed, len(errors)
+
+
+def bench_db(repeat):
+    """Ops/sec for history writes+reads: connect-per-call vs the pooled WAL layer."""
+    import auth
+    import db
+
+    text = sample_mcq_text(5)
+    ops = repeat * 20
+    with tempfile.TemporaryDirectory() as tmp:
+        naive_path = os.path.join(tmp, "naive.db")
+        conn = sqlite3.connect(naive_path)
+        auth._schema_v1(conn)
+        conn.commit()
+        conn.close()
+
+        def naive_write(worker_id, i):
+            conn = sqlite3.connect(naive_path)
+            conn.execute(
+                "INSERT INTO history (email, topic, mcq_text, pdf_path) VALUES (?, ?, ?, ?)",
+                (f"user{worker_id}@example.com", f"Topic {i}", text, None)
+            )
+            conn.commit()
+            conn.execute(
+                "SELECT id, topic, created_at FROM history WHERE email=? ORDER BY created_at DESC",
+                (f"user{worker_id}@example.com",)
+            ).fetchall()
+            conn.close()
+
+        db.set_database(os.path.join(tmp, "pooled.db"))
+        auth.create_tables()
+
+        def pooled_write(worker_id, i):
+            auth.save_history(f"user{worker_id}@example.com", f"Topic {i}", text, None)
+            auth.get_sessions(f"user{worker_id}@example.com")
+
+        print(f"{'writers':>8} {'mode':>8} {'ops/sec':>10} {'errors':>7}")
+        for writers in (1, 8, 32):
+            for mode, write in (("naive", naive_write), ("pooled", pooled_write)):
+                rate, errors = _run_writers(write, writers, ops)
+                print(f"{writers:>8} {mode:>8} {rate:>10.0f} {errors:>7}")
+
+        db.get_pool().close()
+
+
+def bench_rerun(repeat):
+    """Per-rerun setup cost of app.py before and after process-level init."""
+    import auth
+    import bootstrap
+    import db
+    from config import Config
+
+    runs = repeat * 10
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "rerun.db")
+        db.set_database(db_path)
+
+        def per_rerun():
+            # What every interaction used to pay: validation, CSS, DDL, client
+            Config.validate_config()
+            Config.get_css_styles()
+            conn = sqlite3.connect(db_path)
+            for migration in auth.MIGRATIONS:
+                migration(conn)
+            conn.commit()
+            conn.close()
+            bootstrap.get_llm.__wrapped__("benchmark-key")
+
+        def cached():
+            bootstrap.initialize()
+            bootstrap.get_css()
+            bootstrap.get_llm("benchmark-key")
+
+        report("setup on every rerun", timed(per_rerun, runs))
+        report("process-level init", timed(cached, runs))
+        db.get_pool().close()
+
+
+E2E_SIZES = (1, 20, 100)
+E2E_STAGES = ("prompt", "generate", "to_text", "pdf", "history")
+
+
+def bench_e2e(repeat):
+    """Full request path against the mock LLM: latency percentiles per stage."""
+    import auth
+    import db
+    from config import Config
+    from generator import stream_mcqs, generate_chunked
+    from llm_backend import create_llm
+    from pdf_generator import render_pdf
+    from prompt import build_prompt
+    from rate_limiter import RateLimiter, set_limiter
+
+    # Measure the app, not the Groq budget
+    set_limiter(RateLimiter(10 ** 6, 10 ** 9))
+    llm = create_llm(backend="mock")
+    print(f"mock LLM: ttft {Config.MOCK_LLM['ttft']}s, {Config.MOCK_LLM['tokens_per_sec']} tok/s, "
+          f"failure rate {Config.MOCK_LLM['failure_rate']:.0%}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.set_database(os.path.join(tmp, "e2e.db"))
+        auth.create_tables()
+
+        for size in E2E_SIZES:
+            stages = {stage: [] for stage in E2E_STAGES}
+            totals = []
+            errors = 0
+            for run in range(repeat):
+                marks = [time.perf_counter()]
+                try:
+                    prompt = build_prompt("Cell Biology", size, "Medium")
+                    marks.append(time.perf_counter())
+                    if size > Config.AI_CONFIG["chunk_size"]:
+                        quiz, _ = generate_chunked(llm, "Cell Biology", size, "Medium")
+                    else:
+                        quiz, _ = stream_mcqs(llm, prompt, topic="Cell Biology", level="Medium")
+                    marks.append(time.perf_counter())
+                    text = quiz.to_text()
+                    marks.append(time.perf_counter())
+                    render_pdf(quiz, topic="Cell Biology", user_email="bench@example.com")
+                    marks.append(time.perf_counter())
+                    auth.save_history("bench@example.com", "Cell Biology", text, None, quiz=quiz)
+                    auth.get_sessions("bench@example.com")
+                    auth.get_user_stats("bench@example.com")
+                    marks.append(time.perf_counter())
+                except Exception as e:
+                    errors += 1
+                    print(f"  run {run} failed: {e}")
+                    continue
+                for stage, start, end in zip(E2E_STAGES, marks, marks[1:]):
+                    stages[stage].append((end - start) * 1000)
+                totals.append((marks[-1] - marks[0]) * 1000)
+
+            print(f"\n{size} question(s), {len(totals)} ok / {errors} failed")
+            if not totals:
+                continue
+            print(f"  {'stage':<10} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10}")
+            for stage in E2E_STAGES + ("total",):
+                p50, p95, p99 = percentiles(totals if stage == "total" else stages[stage])
+                print(f"  {stage:<10} {p50:>10.2f} {p95:>10.2f} {p99:>10.2f}")
+            seconds = sum(totals) / 1000
+            print(f"  throughput: {len(totals) / seconds:.2f} quizzes/s, "
+                  f"{len(totals) * size / seconds:.1f} questions/s")
+
+        db.get_pool().close()
+
+
+SUITES = {
+    "parse": bench_parse,
+    "pdf": bench_pdf,
+    "db": bench_db,
+    "rerun": bench_rerun,
+    "e2e": bench_e2e,
+    "format": bench_format,
+    "hedge": bench_hedge,
+    "dedup": bench_dedup,
+    "variants": bench_variants,
+    "batch": bench_batch,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run EduQuiz Pro benchmarks")
+    parser.add_argument("suite", choices=sorted(SUITES), help="Benchmark suite to run")
+    parser.add_argument("--repeat", type=int, default=10, help="Runs per measurement")
+    parser.add_argument("--ttft", type=float, help="Mock LLM seconds to first token")
+    parser.add_argument("--tps", type=float, help="Mock LLM tokens per second")
+    parser.add_argument("--failure-rate", type=float, help="Mock LLM injected error rate (0-1)")
+    parser.add_argument("--slow-rate", type=float, help="Mock LLM stalled response rate (0-1)")
+    parser.add_argument("--hedge-after", type=float,
+                        help="Seconds before hedging to the fallback model (hedge suite default: half the mock slow_ttft)")
+    args = parser.parse_args()
+
+    from config import Config
+    for key, value in (("ttft", args.ttft), ("tokens_per_sec", args.tps),
+                       ("failure_rate", args.failure_rate), ("slow_rate", args.slow_rate)):
+        if value is not None:
+            Config.MOCK_LLM[key] = value
+    if args.hedge_after is not None:
+        Config.AI_CONFIG["hedge_after"] = args.hedge_after
+    elif args.suite == "hedge":
+        # The production default is longer than a mock stall, which would never hedge
+        Config.AI_CONFIG["hedge_after"] = Config.MOCK_LLM["slow_ttft"] / 2
+    SUITES[args.suite](args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""
+EduQuiz Pro Bootstrap
+Process-level initialization shared by every Streamlit rerun and session.
+
+Streamlit re-executes app.py on each interaction; everything here runs once
+per process and is then served from memory.
+"""
+
+from functools import lru_cache
+
+from config import Config
+from auth import create_tables
+from cache import get_cache
+from dedup import get_seen_questions
+from llm_backend import create_llm
+import metrics
+
+
+@lru_cache(maxsize=None)
+def initialize():
+    """Validate config, migrate the schema and warm shared resources once."""
+    if not Config.validate_config():
+        return False
+    create_tables()
+    get_cache()
+    get_seen_questions()
+    metrics.start()
+    return True
+
+
+@lru_cache(maxsize=None)
+def get_css():
+    """The assembled stylesheet; it only depends on static config."""
+    return Config.get_css_styles()
+
+
+@lru_cache(maxsize=8)
+def get_llm(api_key, model_name=None, max_tokens=2000, temperature=0.7):
+    """Shared chat model so the Groq HTTP connection pool is reused."""
+    return create_llm(api_key, model_name, max_tokens, temperature)
@@ -0,0 +1,202 @@
+"""
+EduQuiz Pro Bulk Generator
+Headless batch generation of many quizzes from a CSV or JSONL request file.
+
+Usage:
+    python bulk_generate.py requests.csv --output quizzes.jsonl --pdf
+    python bulk_generate.py requests.csv --book exam_book.pdf
+
+Each input row needs ``topic`` and may set ``level`` and ``num_questions``.
+Completed quizzes are appended to the output file as they finish, so a
+crashed or interrupted run resumes where it stopped without re-spending
+tokens on finished rows.
+"""
+
+import argparse
+import asyncio
+import csv
+import hashlib
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+from config import Config
+from quiz import QuizSet
+from generator import agenerate_chunked, arepair_quiz, token_budget
+from rate_limiter import RateLimiter, set_limiter
+from auth import create_tables, save_questions
+
+
+def job_id(row_number, topic, level, num_questions):
+    raw = f"{row_number}|{topic}|{level}|{num_questions}"
+    return hashlib.sha256(raw.encode()).hexdigest()[:16]
+
+
+def read_jobs(path):
+    """Load request rows from a .csv or .jsonl file."""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+
+    jobs = []
+    for number, row in enumerate(rows, start=1):
+        topic = (row.get("topic") or "").strip()
+        if not topic:
+            print(f"Skipping row {number}: missing topic", file=sys.stderr)
+            continue
+        level = (row.get("level") or "Medium").strip().title()
+        num_questions = int(row.get("num_questions") or Config.AI_CONFIG["default_questions"])
+        jobs.append({
+            "id": job_id(number, topic, level, num_questions),
+            "topic": topic,
+            "level": level,
+            "num_questions": num_questions,
+        })
+    return jobs
+
+
+def completed_ids(output_path):
+    """IDs already present in the output file (the checkpoint)."""
+    if not os.path.exists(output_path):
+        return set()
+    done = set()
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)["id"])
+            except (ValueError, KeyError):
+                continue  # a torn final line from a crash is simply redone
+    return done
+
+
+async def run_job(job, llm, model_name, write_result, make_pdf):
+    # Every chunk request passes through the shared rate limiter
+    started = time.perf_counter()
+    quiz, used_tokens = await agenerate_chunked(llm, job["topic"], job["num_questions"], job["level"])
+    if quiz.defects() or len(quiz) < job["num_questions"]:
+        quiz, repair_tokens = await arepair_quiz(llm, quiz, job["num_questions"])
+        used_tokens += repair_tokens
+    text = quiz.to_text()
+    latency = time.perf_counter() - started
+    if Config.BANK["enabled"]:
+        await asyncio.to_thread(save_questions, quiz, model_name, "bulk")
+
+    pdf_path = None
+    if make_pdf:
+        from pdf_generator import get_render_pool, save_pdf
+        # ReportLab is CPU-bound; render on the process pool, off the event loop
+        pdf_path = await asyncio.get_running_loop().run_in_executor(
+            get_render_pool(), save_pdf, quiz, f"bulk_{job['id']}.pdf", job["topic"]
+        )
+
+    write_result({
+        **job,
+        "model": model_name,
+        "mcq_text": text,
+        "quiz": quiz.to_dict(),
+        "tokens": used_tokens,
+        "latency": round(latency, 3),
+        "pdf_path": pdf_path,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+    })
+    print(f"✅ {job['topic']} ({job['level']}, {len(quiz)} questions) in {latency:.1f}s")
+
+
+def write_book(output_path, jobs, book_path):
+    """Bind every finished quiz for ``jobs`` into one exam book PDF."""
+    from pdf_generator import render_exam_book
+
+    wanted = {job["id"]: index for index, job in enumerate(jobs)}
+    found = {}
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("id") in wanted:
+                found[record["id"]] = QuizSet.from_dict(record["quiz"])
+    quizzes = [found[job_id] for job_id in sorted(found, key=wanted.get)]
+    if not quizzes:
+        return 0
+    with open(book_path, "wb") as f:
+        f.write(render_exam_book(quizzes, title="Exam Book"))
+    return len(quizzes)
+
+
+async def run(args):
+    from bootstrap import get_llm
+
+    jobs = read_jobs(args.input)
+    done = completed_ids(args.output)
+    pending = [job for job in jobs if job["id"] not in done]
+    print(f"{len(jobs)} requests, {len(done & {j['id'] for j in jobs})} already done, {len(pending)} to run")
+    if not pending:
+        if args.book:
+            print(f"📚 {write_book(args.output, jobs, args.book)} quizzes bound into {args.book}")
+        return 0
+
+    api_key = os.getenv("GROQ_API_KEY")
+    if not api_key and Config.AI_CONFIG["backend"] == "groq":
+        print("❌ GROQ_API_KEY not found.", file=sys.stderr)
+        return 1
+
+    # One shared client, sized for the largest chunk at the hardest level
+    max_tokens = args.max_tokens or token_budget(Config.AI_CONFIG["chunk_size"], "Hard")
+    llm = get_llm(api_key, args.model, max_tokens)
+    create_tables()
+    db_name = Config.DATABASE["name"] if Config.RATE_LIMITS["shared"] else None
+    set_limiter(RateLimiter(args.rpm, args.tpm, db_name=db_name))
+    semaphore = asyncio.Semaphore(args.concurrency)
+    failures = 0
+
+    with open(args.output, "a", encoding="utf-8") as out:
+        def write_result(record):
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            os.fsync(out.fileno())
+
+        async def guarded(job):
+            nonlocal failures
+            async with semaphore:
+                try:
+                    await run_job(job, llm, args.model, write_result, args.pdf)
+                except Exception as e:
+                    failures += 1
+                    print(f"❌ {job['topic']}: {e}", file=sys.stderr)
+
+        await asyncio.gather(*(guarded(job) for job in pending))
+
+    print(f"Finished: {len(pending) - failures} succeeded, {failures} failed (re-run to retry)")
+    if args.book:
+        print(f"📚 {write_book(args.output, jobs, args.book)} quizzes bound into {args.book}")
+    return 1 if failures else 0
+
+
+def main():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Generate many MCQ sets without the web UI")
+    parser.add_argument("input", help="CSV or JSONL file with topic, level, num_questions")
+    parser.add_argument("--output", default="bulk_results.jsonl", help="JSONL results/checkpoint file")
+    parser.add_argument("--pdf", action="store_true", help="Also render a PDF per quiz into outputs/")
+    parser.add_argument("--book", help="Also bind all quizzes into one exam book PDF at this path")
+    parser.add_argument("--model", default=Config.AI_CONFIG["model_name"], help="Groq model name")
+    parser.add_argument("--max-tokens", type=int, default=None,
+                        help="Completion limit per request (default: sized from the chunk size)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Quizzes generated at once")
+    parser.add_argument("--rpm", type=int, default=Config.RATE_LIMITS["requests_per_minute"],
+                        help="Request budget per minute")
+    parser.add_argument("--tpm", type=int, default=Config.RATE_LIMITS["tokens_per_minute"],
+                        help="Estimated token budget per minute")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+EduQuiz Pro Generation Cache
+Two-tier (in-process LRU + SQLite) cache for generated MCQ sets, plus
+single-flight coalescing of identical requests that are still running.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from config import Config
+from db import get_pool
+from prompt import PROMPT_VERSION
+import metrics
+
+
+def normalize_topic(topic):
+    """Lowercase and collapse whitespace so trivial variations share a key."""
+    return " ".join(topic.lower().split())
+
+
+def make_key(topic, num_questions, level, model_name=None, prompt_version=PROMPT_VERSION,
+             explanations=True, output_format=None):
+    """Hash the normalized request into a stable cache key.
+
+    Questions-only sets (``explanations=False``) get their own key, and
+    so does each output format, as they are built from different templates.
+    """
+    model_name = model_name or Config.AI_CONFIG["model_name"]
+    output_format = output_format or Config.AI_CONFIG["output_format"]
+    parts = [
+        normalize_topic(topic),
+        str(int(num_questions)),
+        level.lower(),
+        model_name,
+        prompt_version,
+        output_format,
+    ]
+    if not explanations:
+        parts.append("questions-only")
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()
+
+
+def cacheable(quiz, num_questions, explanations=True):
+    """Only full, defect-free sets may be served to later requests."""
+    return len(quiz) == num_questions and not quiz.defects(require_explanation=explanations)
+
+
+class GenerationCache:
+    """LRU in front of an SQLite table, both bounded in size and TTL."""
+
+    def __init__(self, pool=None, ttl=None, memory_entries=None, disk_entries=None):
+        self.pool = pool or get_pool()
+        self.ttl = ttl if ttl is not None else Config.CACHE["ttl"]
+        self.memory_entries = memory_entries or Config.CACHE["memory_entries"]
+        self.disk_entries = disk_entries or Config.CACHE["disk_entries"]
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        self._create_table()
+
+    def _create_table(self):
+        with self.pool.connection() as conn:
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS generation_cache (
+                key TEXT PRIMARY KEY,
+                response TEXT,
+                created_at REAL,
+                last_access REAL
+            )
+            """)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_generation_cache_access ON generation_cache (last_access)"
+            )
+
+    def _count(self, name, amount=1):
+        # Caller holds self._lock; mirrored to metrics for the admin page/Prometheus
+        self.stats[name] += amount
+        metrics.increment(f"cache_{name}_total", amount)
+
+    def _remember(self, key, response, created_at):
+        self._memory[key] = (response, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+            self._count("evictions")
+
+    def get(self, key):
+        """Return the cached response for ``key`` or None on miss/expiry."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if now - entry[1] <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self._count("memory_hits")
+                    return entry[0]
+                del self._memory[key]
+
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                "SELECT response, created_at FROM generation_cache WHERE key=?", (key,)
+            ).fetchone()
+            if row and now - row[1] <= self.ttl:
+                conn.execute("UPDATE generation_cache SET last_access=? WHERE key=?", (now, key))
+            elif row:
+                conn.execute("DELETE FROM generation_cache WHERE key=?", (key,))
+                row = None
+
+        with self._lock:
+            if row is None:
+                self._count("misses")
+                return None
+            self._count("disk_hits")
+            self._remember(key, row[0], row[1])
+        return row[0]
+
+    def put(self, key, response):
+        """Store a response in both tiers and trim the disk tier to size."""
+        now = time.time()
+        with self._lock:
+            self._remember(key, response, now)
+
+        with self.pool.connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO generation_cache (key, response, created_at, last_access) "
+                "VALUES (?, ?, ?, ?)",
+                (key, response, now, now)
+            )
+            conn.execute("DELETE FROM generation_cache WHERE created_at < ?", (now - self.ttl,))
+            removed = conn.execute(
+                "DELETE FROM generation_cache WHERE key IN ("
+                "SELECT key FROM generation_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.disk_entries,)
+            ).rowcount
+
+        if removed > 0:
+            with self._lock:
+                self._count("evictions", removed)
+
+    def hit_rate(self):
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+
+class SingleFlight:
+    """Lets concurrent callers with the same key share one execution.
+
+    The first caller for a key (the leader) runs the work; callers arriving
+    while it is in flight block on its future and receive the same result
+    or exception, so a classroom submitting one topic costs one LLM call.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.stats = {"leaders": 0, "saved_calls": 0}
+
+    def do(self, key, func, on_join=None, timeout=None):
+        """Return ``(func() result, shared)``; ``shared`` is True for joiners."""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.stats["leaders"] += 1
+            else:
+                self.stats["saved_calls"] += 1
+
+        if not leader:
+            metrics.increment("singleflight_saved_calls_total")
+            if on_join:
+                on_join()
+            return future.result(timeout or Config.AI_CONFIG["timeout"]), True
+
+        metrics.increment("singleflight_calls_total")
+        try:
+            result = func()
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        except BaseException:
+            # Streamlit stops/reruns the leader's script with BaseExceptions;
+            # joiners get an ordinary error instead of that control flow.
+            future.set_exception(RuntimeError("The shared generation was interrupted, please try again"))
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+_single_flight = SingleFlight()
+
+
+def get_cache():
+    """Process-wide cache shared by every Streamlit session."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = GenerationCache()
+        return _cache
+
+
+def get_single_flight():
+    """Process-wide request coalescer shared by every Streamlit session."""
+    return _single_flight
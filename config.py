@@ -43,18 +43,110 @@ class Config:
     DATABASE = {
         "name": "users.db",
         "backup_enabled": True,
-        "backup_interval": 24  # hours
+        "backup_interval": 24,  # hours
+        "pool_size": 8,
+        "busy_timeout": 5000,  # milliseconds
+        "mmap_size": 64 * 1024 * 1024,  # bytes
+        "statement_cache": 128
     }
     
     # AI Model Configuration
     AI_CONFIG = {
         "model_name": "llama-3.3-70b-versatile",
         "api_provider": "groq",
-        "max_questions": 20,
+        "backend": os.getenv("LLM_BACKEND", "groq"),  # "groq" or "mock"
+        "output_format": os.getenv("OUTPUT_FORMAT", "text"),  # "text" or compact "json"
+        "max_questions": 100,
         "min_questions": 1,
         "default_questions": 5,
         "difficulty_levels": ["Easy", "Medium", "Hard"],
-        "timeout": 300  # seconds
+        "timeout": 300,  # seconds
+        "fallback_model": os.getenv("GROQ_FALLBACK_MODEL", "llama-3.1-8b-instant"),  # "" disables
+        "hedge_after": 20.0,  # seconds before a slow full response is hedged (None: fallback only)
+        "hedge_ttft_after": 3.0,  # seconds to first streamed token before hedging
+        "chunk_size": 5,  # questions per parallel request
+        "max_concurrency": 20,  # simultaneous chunk requests
+        "tokens_per_question": {"Easy": 120, "Medium": 150, "Hard": 200},  # completion budget
+        "token_overhead": 150,  # preamble and formatting slack per response
+        "max_completion_tokens": 8000,
+        "max_continuations": 2,  # follow-up requests after a truncated response
+        "max_repairs": 2,  # follow-up requests to replace invalid questions
+        "lazy_explanations": False,  # default for "questions first" mode in the form
+        "explanation_tokens": 60,  # share of tokens_per_question spent on the explanation
+        "explanation_batch_size": 10  # questions explained per follow-up request
+    }
+    
+    # Model routing: small/easy requests go to a faster model
+    ROUTING = {
+        "enabled": True,
+        "small_model": "llama-3.1-8b-instant",
+        "small_max_questions": {"Easy": 20, "Medium": 5, "Hard": 0},  # largest set routed small
+        "min_samples": 20,  # generations per model before observed latency can override the rule
+        # USD per million completion tokens, for the cost column of route stats
+        "token_prices": {"llama-3.3-70b-versatile": 0.79, "llama-3.1-8b-instant": 0.08}
+    }
+    
+    # Local stand-in model used when backend is "mock"
+    MOCK_LLM = {
+        "ttft": 0.3,  # seconds to first token
+        "tokens_per_sec": 250.0,
+        "failure_rate": 0.0,  # probability of an injected API error
+        "failure_status": 429,
+        "slow_rate": 0.0,  # probability of a stalled response (tail latency)
+        "slow_ttft": 5.0,  # seconds to first token for stalled responses
+        "seed": 0
+    }
+    
+    # Groq API budgets (per process)
+    RATE_LIMITS = {
+        "requests_per_minute": 30,
+        "tokens_per_minute": 12000,
+        "shared": False,  # coordinate the bucket across processes via users.db
+        "max_retries": 4,
+        "backoff_base": 1.0,  # seconds
+        "backoff_cap": 30.0  # seconds
+    }
+    
+    # Instrumentation
+    METRICS = {
+        "enabled": True,
+        "port": int(os.getenv("METRICS_PORT", "9464")),  # Prometheus /metrics
+        "buffer_size": 1000,  # recent samples kept per stage
+        "flush_interval": 30,  # seconds between SQLite flushes
+        "max_pending": 50000,  # unflushed samples kept if flushes fail
+        "retention": 7 * 24 * 3600  # seconds of flushed history kept
+    }
+    
+    # Generation Cache
+    CACHE = {
+        "enabled": True,
+        "ttl": 7 * 24 * 3600,  # seconds
+        "memory_entries": 256,
+        "disk_entries": 5000
+    }
+    
+    # Exam versions (shuffled variants of one quiz)
+    EXAMS = {
+        "min_versions": 2,
+        "max_versions": 10,
+        "default_versions": 4
+    }
+    
+    # Question Bank (every complete generated question, searchable via FTS5)
+    BANK = {
+        "enabled": True,
+        "candidate_factor": 3  # matches considered per question requested, sampled for variety
+    }
+    
+    # Near-duplicate detection against questions a user has already seen
+    DEDUP = {
+        "enabled": True,
+        "threshold": 0.6,  # estimated Jaccard similarity of stem shingles
+        "shingle_size": 5,  # characters
+        "num_perm": 128,  # MinHash signature length
+        "bands": 32,  # LSH bands (num_perm / bands rows each)
+        "avoid_limit": 25,  # recent stems listed in the prompt's avoid section
+        "max_users": 256  # per-user indexes kept in memory
     }
     
     # File Storage
@@ -62,11 +154,20 @@ class Config:
         "output_dir": "outputs",
         "pdf_prefix": "mcqs_",
         "max_file_size": 10 * 1024 * 1024,  # 10MB
-        "allowed_extensions": [".pdf"]
+        "allowed_extensions": [".pdf"],
+        "persist_pdfs": False  # keep a content-addressed copy in output_dir
+    }
+    
+    # Batch PDF rendering (exam packs, multi-session exports, bulk CLI)
+    PDF_RENDER = {
+        "max_workers": int(os.getenv("PDF_WORKERS", "0")) or None,  # None = one per CPU core
+        "min_batch": 2,  # smaller batches render in-process
+        "start_method": "spawn"  # fresh workers; forking Streamlit's threads is unsafe
     }
     
     # Security Settings
     SECURITY = {
+        "admin_emails": [e.strip() for e in os.getenv("ADMIN_EMAILS", "").split(",") if e.strip()],
         "min_password_length": 6,
         "session_timeout": 3600,  # seconds
         "max_login_attempts": 5
@@ -0,0 +1,126 @@
+"""
+EduQuiz Pro Database Layer
+Thread-safe pool of tuned SQLite connections with one-time schema migration.
+"""
+
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from config import Config
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA foreign_keys=ON",
+)
+
+
+class ConnectionPool:
+    """Fixed-size pool of WAL-mode connections shared by all sessions.
+
+    Each connection keeps its own prepared-statement cache, so repeated
+    queries from ``auth.py`` are compiled once per connection rather than
+    once per call.
+    """
+
+    def __init__(self, db_name=None, size=None):
+        self.db_name = db_name or Config.DATABASE["name"]
+        self.size = size or Config.DATABASE["pool_size"]
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._migrate_lock = threading.Lock()
+        self._migrated = False
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.db_name,
+            timeout=Config.DATABASE["busy_timeout"] / 1000,
+            check_same_thread=False,
+            cached_statements=Config.DATABASE["statement_cache"],
+        )
+        conn.execute(f"PRAGMA busy_timeout={Config.DATABASE['busy_timeout']}")
+        conn.execute(f"PRAGMA mmap_size={Config.DATABASE['mmap_size']}")
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return self._connect()
+        return self._idle.get()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; commit on success, roll back on error."""
+        conn = self._acquire()
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            # Includes KeyboardInterrupt and Streamlit's rerun/stop exceptions, so
+            # no connection goes back to the pool with a transaction still open
+            conn.rollback()
+            raise
+        finally:
+            self._idle.put(conn)
+
+    def migrate(self, migrations):
+        """Apply pending schema migrations once per process.
+
+        ``migrations`` is an ordered list of callables taking a connection;
+        the number applied so far is tracked in ``PRAGMA user_version`` so
+        reruns and new processes skip straight past existing DDL.
+        """
+        if self._migrated:
+            return
+        with self._migrate_lock:
+            if self._migrated:
+                return
+            with self.connection() as conn:
+                version = conn.execute("PRAGMA user_version").fetchone()[0]
+                for number, migration in enumerate(migrations[version:], start=version + 1):
+                    migration(conn)
+                    conn.execute(f"PRAGMA user_version={number}")
+            self._migrated = True
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._created = 0
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Process-wide pool for the configured database."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool()
+        return _pool
+
+
+def set_database(db_name, size=None):
+    """Point the shared pool at another database file (benchmarks, tools)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        _pool = ConnectionPool(db_name, size)
+        return _pool
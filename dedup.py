@@ -0,0 +1,219 @@
+"""
+EduQuiz Pro Near-Duplicate Detection
+MinHash/LSH index over question stems, and the per-user store of questions
+each account has already been shown.
+
+Signatures use densified one-permutation MinHash (a single CRC32 per
+character shingle, binned into ``num_perm`` slots) so indexing stays cheap
+in pure Python; LSH banding turns lookups into a few dictionary probes regardless
+of how many stems are stored.
+"""
+
+import functools
+import random
+import threading
+import zlib
+from array import array
+from collections import OrderedDict
+
+from config import Config
+from cache import normalize_topic
+from db import get_pool
+from quiz import WORD_RE
+import metrics
+
+EMPTY = 0xFFFFFFFF
+
+
+# Question boilerplate shared by unrelated stems; left in, it floods LSH buckets
+STOP_WORDS = frozenset(
+    "a an and are as at be by do does for following from how in is it of on or the this "
+    "to was what when where which who why with".split()
+)
+
+
+def normalize_stem(stem):
+    return " ".join(w for w in WORD_RE.findall(stem.lower()) if w not in STOP_WORDS)
+
+
+def shingles(stem, size=None):
+    """Overlapping character n-grams of the normalized stem."""
+    size = size or Config.DEDUP["shingle_size"]
+    text = normalize_stem(stem)
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+@functools.lru_cache(maxsize=None)
+def _probe_orders(num_perm):
+    rng = random.Random(num_perm)
+    return tuple(tuple(rng.sample(range(num_perm), num_perm)) for _ in range(num_perm))
+
+
+def signature(stem, num_perm=None, shingle_size=None):
+    """MinHash signature of a stem as an ``array('I')`` of ``num_perm`` values."""
+    num_perm = num_perm or Config.DEDUP["num_perm"]
+    slots = [EMPTY] * num_perm
+    for shingle in shingles(stem, shingle_size):
+        h = zlib.crc32(shingle.encode())
+        slot, value = h % num_perm, h // num_perm
+        if value < slots[slot]:
+            slots[slot] = value
+    # Densify: an empty slot borrows from the first filled slot in its own
+    # fixed probe order, so bands stay independent even for short stems
+    filled = [value != EMPTY for value in slots]
+    if any(filled) and not all(filled):
+        for i, order in enumerate(_probe_orders(num_perm)):
+            if not filled[i]:
+                for j in order:
+                    if filled[j]:
+                        slots[i] = slots[j]
+                        break
+    return array("I", slots)
+
+
+def estimate(a, b):
+    """Estimated Jaccard similarity of two signatures."""
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+
+class StemIndex:
+    """LSH index of stem signatures for sub-linear near-duplicate lookup."""
+
+    def __init__(self, num_perm=None, bands=None, threshold=None):
+        self.num_perm = num_perm or Config.DEDUP["num_perm"]
+        self.bands = bands or Config.DEDUP["bands"]
+        self.threshold = threshold or Config.DEDUP["threshold"]
+        self.rows = self.num_perm // self.bands
+        self.stems = []
+        self._signatures = []
+        self._buckets = [{} for _ in range(self.bands)]
+
+    def __len__(self):
+        return len(self.stems)
+
+    def _keys(self, sig):
+        raw = sig.tobytes()
+        width = self.rows * sig.itemsize
+        return [raw[band * width:(band + 1) * width] for band in range(self.bands)]
+
+    def add(self, stem, sig=None):
+        sig = sig if sig is not None else signature(stem, self.num_perm)
+        item = len(self.stems)
+        self.stems.append(stem)
+        self._signatures.append(sig)
+        for buckets, key in zip(self._buckets, self._keys(sig)):
+            buckets.setdefault(key, []).append(item)
+
+    def query(self, stem, threshold=None, sig=None):
+        """Stored stems at least ``threshold`` similar, best first, as (similarity, stem)."""
+        threshold = threshold or self.threshold
+        sig = sig if sig is not None else signature(stem, self.num_perm)
+        candidates = set()
+        for buckets, key in zip(self._buckets, self._keys(sig)):
+            candidates.update(buckets.get(key, ()))
+        found = []
+        for item in candidates:
+            score = estimate(sig, self._signatures[item])
+            if score >= threshold:
+                found.append((score, self.stems[item]))
+        return sorted(found, reverse=True)
+
+    def match(self, stem, threshold=None):
+        """The most similar stored stem, or None."""
+        found = self.query(stem, threshold)
+        return found[0][1] if found else None
+
+
+class SeenQuestions:
+    """Stems each user has been shown, persisted in SQLite and indexed per user.
+
+    Per-user indexes are built on first use from stored signatures and kept
+    in a small LRU; ``record`` updates the table and any loaded index. The
+    ``seen_questions`` table is created by ``auth.MIGRATIONS``.
+    """
+
+    def __init__(self, pool=None, max_users=None):
+        self.pool = pool or get_pool()
+        self.max_users = max_users or Config.DEDUP["max_users"]
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _load(self, email):
+        index = StemIndex()
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                "SELECT stem, signature FROM seen_questions WHERE email=? ORDER BY id",
+                (email,)
+            ).fetchall()
+        for stem, raw in rows:
+            sig = array("I")
+            sig.frombytes(raw)
+            index.add(stem, sig if len(sig) == index.num_perm else None)
+        return index
+
+    def index(self, email):
+        """The user's ``StemIndex``, loaded from SQLite on first use."""
+        with self._lock:
+            index = self._indexes.get(email)
+            if index is not None:
+                self._indexes.move_to_end(email)
+                return index
+        with metrics.track("dedup_load_index"):
+            index = self._load(email)
+        with self._lock:
+            index = self._indexes.setdefault(email, index)
+            while len(self._indexes) > self.max_users:
+                self._indexes.popitem(last=False)
+        return index
+
+    def duplicates(self, email, quiz, threshold=None):
+        """Map question indices of ``quiz`` to the earlier stem each repeats."""
+        index = self.index(email)
+        found = {}
+        for i, question in enumerate(quiz.questions):
+            match = index.match(question.stem, threshold)
+            if match is not None:
+                found[i] = match
+        metrics.increment("dedup_matches_total", len(found))
+        return found
+
+    def record(self, email, quiz):
+        """Remember the stems of a quiz shown to ``email``."""
+        index = self.index(email)
+        topic_key = normalize_topic(quiz.topic)
+        rows = []
+        with self._lock:
+            for question in quiz.questions:
+                sig = signature(question.stem, index.num_perm)
+                index.add(question.stem, sig)
+                rows.append((email, topic_key, question.stem, sig.tobytes()))
+        with self.pool.connection() as conn:
+            conn.executemany(
+                "INSERT INTO seen_questions (email, topic_key, stem, signature) VALUES (?, ?, ?, ?)",
+                rows
+            )
+
+    def recent(self, email, topic, limit=None):
+        """Latest stems the user saw on this topic, for the prompt's avoid list."""
+        limit = limit if limit is not None else Config.DEDUP["avoid_limit"]
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                "SELECT stem FROM seen_questions WHERE email=? AND topic_key=? ORDER BY id DESC LIMIT ?",
+                (email, normalize_topic(topic), limit)
+            ).fetchall()
+        return [stem for (stem,) in rows]
+
+
+_seen = None
+_seen_lock = threading.Lock()
+
+
+def get_seen_questions():
+    """Process-wide store shared by every Streamlit session."""
+    global _seen
+    with _seen_lock:
+        if _seen is None:
+            _seen = SeenQuestions()
+        return _seen
@@ -0,0 +1,640 @@
+"""
+EduQuiz Pro Generation Module
+Streaming MCQ generation on top of the Groq chat model.
+"""
+
+import asyncio
+import itertools
+import json
+import queue
+import re
+import threading
+import time
+
+from config import Config
+from prompt import build_generation_prompt, build_continuation_prompt, build_explanation_prompt
+from quiz import (
+    DUPLICATE_THRESHOLD,
+    QuizSet,
+    is_json_output,
+    parse_explanations,
+    parse_quiz,
+    parse_quiz_json,
+    question_from_item,
+    similarity,
+    stem_words
+)
+from rate_limiter import estimate_tokens, limited_call, alimited_call
+import metrics
+
+# A new question starts with "N." / "N)" or "Question N:" at the start of a line
+QUESTION_START = re.compile(r"^\s*(?:\*\*)?(?:question\s*)?\d+\s*[.):]", re.IGNORECASE)
+NON_WORD = re.compile(r"[^a-z0-9]+")
+
+# Distinct angles handed to parallel chunks so they do not overlap
+SUB_FOCUSES = [
+    "core definitions and terminology",
+    "fundamental principles and how they work",
+    "practical applications and real-world examples",
+    "common misconceptions and pitfalls",
+    "comparisons between related concepts",
+    "problem-solving and worked scenarios",
+    "history, origins, and key contributors",
+    "cause-and-effect relationships",
+    "edge cases and exceptions",
+    "analysis and interpretation of results",
+    "best practices and recommended approaches",
+    "advanced and specialised aspects",
+]
+
+
+class StreamStats:
+    """Real timing figures collected while a response streams in."""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.first_token_at = None
+        self.finished_at = None
+        self.tokens = 0
+        self.finish_reason = None
+        self.route = None  # "primary", "hedge" or "fallback" behind a HedgedLLM
+        self.json_reply = False  # the reply used the JSON output format
+
+    def record_chunk(self, n_tokens=1):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        self.tokens += n_tokens
+
+    def finish(self, total_tokens=None):
+        self.finished_at = time.perf_counter()
+        if total_tokens:
+            self.tokens = total_tokens
+
+    @property
+    def ttft(self):
+        """Seconds from request to first streamed token."""
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.started_at
+
+    @property
+    def elapsed(self):
+        end = self.finished_at or time.perf_counter()
+        return end - self.started_at
+
+    @property
+    def tokens_per_sec(self):
+        if self.first_token_at is None:
+            return 0.0
+        end = self.finished_at or time.perf_counter()
+        window = end - self.first_token_at
+        return self.tokens / window if window > 0 else 0.0
+
+
+class IncrementalMCQParser:
+    """Splits a streaming response into question blocks as soon as they close.
+
+    A question is considered complete when the next "N." header arrives, so
+    only whole lines are inspected and each character is scanned once.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._current = []
+        self.preamble = []
+
+    def feed(self, text):
+        """Add streamed text and return any question blocks that completed."""
+        self._buffer += text
+        completed = []
+        while "\n" in self._buffer:
+            line, self._buffer = self._buffer.split("\n", 1)
+            block = self._push_line(line)
+            if block:
+                completed.append(block)
+        return completed
+
+    def flush(self):
+        """Return the final question block once the stream has ended."""
+        completed = []
+        if self._buffer:
+            block = self._push_line(self._buffer)
+            self._buffer = ""
+            if block:
+                completed.append(block)
+        if self._current:
+            completed.append("\n".join(self._current).strip())
+            self._current = []
+        return completed
+
+    def _push_line(self, line):
+        if QUESTION_START.match(line):
+            block = "\n".join(self._current).strip() if self._current else None
+            self._current = [line]
+            return block
+        if self._current:
+            self._current.append(line)
+        elif line.strip():
+            self.preamble.append(line)
+        return None
+
+
+class IncrementalJSONParser:
+    """Builds questions from a streaming JSON-mode reply as each item closes.
+
+    Decoding restarts at the first unfinished item and is only tried once a
+    closing brace has arrived after it; consumed text is dropped.
+    """
+
+    _decoder = json.JSONDecoder()
+
+    def __init__(self):
+        self._buffer = ""
+        self._started = False
+        self.questions = []
+
+    def feed(self, text):
+        """Add streamed text and return any questions that completed."""
+        self._buffer += text
+        if not self._started:
+            start = self._buffer.find("[")
+            if start < 0:
+                return []
+            self._buffer = self._buffer[start + 1:]
+            self._started = True
+        completed = []
+        while True:
+            start = self._buffer.find("{")
+            if start < 0 or self._buffer.find("}", start) < 0:
+                break
+            try:
+                item, end = self._decoder.raw_decode(self._buffer, start)
+            except ValueError:
+                break
+            self._buffer = self._buffer[end:]
+            if isinstance(item, dict):
+                question = question_from_item(item, len(self.questions) + 1)
+                self.questions.append(question)
+                completed.append(question)
+        return completed
+
+    def flush(self):
+        """Nothing is pending: a half-written item is never a question."""
+        return []
+
+
+def _chunk_text(chunk):
+    return chunk.content if hasattr(chunk, "content") else str(chunk)
+
+
+def _usage_tokens(chunk):
+    usage = getattr(chunk, "usage_metadata", None) or {}
+    return usage.get("output_tokens")
+
+
+def parse_response(text, topic="", level=""):
+    """Parse a reply in either output format straight into a ``QuizSet``."""
+    if is_json_output(text):
+        return parse_quiz_json(text, topic, level)
+    return parse_quiz(text, topic, level)
+
+
+def _finish_reason(chunk):
+    metadata = getattr(chunk, "response_metadata", None) or {}
+    return metadata.get("finish_reason")
+
+
+def _route(chunk):
+    metadata = getattr(chunk, "response_metadata", None) or {}
+    return metadata.get("route")
+
+
+def _max_tokens(llm):
+    return getattr(llm, "max_tokens", None)
+
+
+def token_budget(num_questions, level, explanations=True):
+    """Completion tokens needed for ``num_questions`` at ``level``."""
+    rates = Config.AI_CONFIG["tokens_per_question"]
+    per_question = rates.get(level, max(rates.values()))
+    if not explanations:
+        per_question -= Config.AI_CONFIG["explanation_tokens"]
+    budget = Config.AI_CONFIG["token_overhead"] + num_questions * per_question
+    return min(budget, Config.AI_CONFIG["max_completion_tokens"])
+
+
+def explanation_budget(num_questions=None):
+    """Completion tokens for one explanation batch of ``num_questions``."""
+    num_questions = num_questions or Config.AI_CONFIG["explanation_batch_size"]
+    budget = Config.AI_CONFIG["token_overhead"] + num_questions * Config.AI_CONFIG["explanation_tokens"]
+    return min(budget, Config.AI_CONFIG["max_completion_tokens"])
+
+
+def _open_stream(llm, prompt, on_wait=None):
+    """Start a stream under the rate limiter and return its first chunk.
+
+    Connection and 429/5xx errors surface on the first ``next()``, so
+    pulling it inside ``limited_call`` lets those be retried safely before
+    anything has been shown to the user.
+    """
+    def start():
+        iterator = iter(llm.stream(prompt))
+        return next(iterator, None), iterator
+
+    return limited_call(start, estimate_tokens(prompt, _max_tokens(llm)), on_wait)
+
+
+def stream_mcqs(llm, prompt, on_question=None, on_progress=None, on_wait=None, topic="", level=""):
+    """Stream a completion, calling back for every finished question.
+
+    Text and JSON-mode replies are both split as they stream; the format is
+    picked from the first visible character.
+
+    Args:
+        llm: A LangChain chat model exposing ``stream``.
+        prompt: Prompt text built by ``prompt.build_generation_prompt``.
+        on_question: Called with ``(index, block_text)`` per completed question.
+        on_progress: Called with the ``StreamStats`` after every chunk.
+        on_wait: Called with ``(queue_position, waited_seconds)`` while the
+            shared rate limiter holds the request back.
+        topic, level: Stored on the returned ``QuizSet``.
+
+    Returns:
+        Tuple of the parsed ``QuizSet`` and the final ``StreamStats``.
+    """
+    stats = StreamStats()
+    parser = None
+    parts = []
+    count = 0
+    usage_total = None
+
+    def emit(blocks):
+        nonlocal count
+        for block in blocks:
+            count += 1
+            if on_question:
+                on_question(count, block if isinstance(block, str) else block.to_text())
+
+    first, rest = _open_stream(llm, prompt, on_wait)
+    chunks = rest if first is None else itertools.chain([first], rest)
+
+    for chunk in chunks:
+        text = _chunk_text(chunk)
+        usage_total = _usage_tokens(chunk) or usage_total
+        stats.finish_reason = _finish_reason(chunk) or stats.finish_reason
+        stats.route = _route(chunk) or stats.route
+        metrics.record_usage(chunk)
+        if not text:
+            continue
+        parts.append(text)
+        stats.record_chunk()
+        if parser is None:
+            if not text.strip():
+                continue
+            stats.json_reply = is_json_output(text)
+            parser = IncrementalJSONParser() if stats.json_reply else IncrementalMCQParser()
+        emit(parser.feed(text))
+        if on_progress:
+            on_progress(stats)
+
+    if parser is not None:
+        emit(parser.flush())
+
+    stats.finish(usage_total)
+    metrics.observe("llm_call", stats.elapsed)
+    if stats.ttft is not None:
+        metrics.observe("llm_ttft", stats.ttft)
+    if isinstance(parser, IncrementalJSONParser):
+        return QuizSet(parser.questions, topic, level), stats
+    return parse_quiz("".join(parts), topic, level), stats
+
+
+def is_complete_question(question, explanations=True):
+    """True when a question got as far as its answer (and explanation)."""
+    return bool(question.answer) and (bool(question.explanation.strip()) or not explanations)
+
+
+def _stem_key(question):
+    return NON_WORD.sub(" ", question.stem.lower()).strip()
+
+
+def merge_questions(question_lists):
+    """Concatenate chunk results, drop repeated stems and renumber from 1."""
+    merged = []
+    seen = set()
+    for questions in question_lists:
+        for question in questions:
+            key = _stem_key(question)
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            question.number = len(merged) + 1
+            merged.append(question)
+    return merged
+
+
+def plan_chunks(num_questions, chunk_size=None):
+    """Return the question count for each chunk, e.g. 12 -> [5, 5, 2]."""
+    chunk_size = chunk_size or Config.AI_CONFIG["chunk_size"]
+    sizes = [chunk_size] * (num_questions // chunk_size)
+    if num_questions % chunk_size:
+        sizes.append(num_questions % chunk_size)
+    return sizes
+
+
+async def acontinue_truncated(llm, quiz, num_questions,
+                              finish_reason=None, focus=None, on_wait=None, explanations=True,
+                              json_reply=False):
+    """Top up a cut-off response with only the questions it is missing.
+
+    A response counts as truncated when the model stopped on its token
+    limit or the final question lacks its answer/explanation. The partial
+    question is dropped and a follow-up asks for the remainder, up to
+    ``max_continuations`` times. A text reply stopped on its limit may end
+    mid-explanation, so its last question is dropped too; JSON replies
+    (``json_reply``) only ever yield whole items and keep theirs.
+
+    Returns:
+        Tuple of the stitched ``QuizSet`` (``quiz`` itself if nothing was
+        cut off) and the completion tokens the follow-ups spent.
+    """
+    topic, level = quiz.topic, quiz.level
+    blocks = list(quiz.questions)
+    def complete(question):
+        return is_complete_question(question, explanations)
+
+    truncated = finish_reason == "length" or bool(blocks and not complete(blocks[-1]))
+    if not truncated:
+        return quiz, 0
+
+    tokens = 0
+    for _ in range(Config.AI_CONFIG["max_continuations"]):
+        cut_off = finish_reason == "length" and not json_reply
+        if blocks and (cut_off or not complete(blocks[-1])):
+            blocks.pop()
+        missing = num_questions - len(blocks)
+        if missing <= 0:
+            truncated = False
+            break
+        prompt = build_continuation_prompt(
+            topic, missing, level, [_stem_key(b) for b in blocks], focus, explanations
+        )
+        started = time.perf_counter()
+        response = await alimited_call(
+            lambda: llm.ainvoke(prompt),
+            estimate_tokens(prompt, _max_tokens(llm)),
+            on_wait
+        )
+        metrics.observe("llm_continuation", time.perf_counter() - started)
+        metrics.record_usage(response)
+        metrics.increment("continuations_total")
+        tokens += _usage_tokens(response) or 0
+        text = _chunk_text(response)
+        new_blocks = parse_response(text).questions
+        finish_reason = _finish_reason(response)
+        json_reply = is_json_output(text)
+        truncated = finish_reason == "length" or bool(new_blocks and not complete(new_blocks[-1]))
+        blocks = merge_questions([blocks, new_blocks])
+        if not truncated:
+            break
+
+    if truncated and blocks and not complete(blocks[-1]):
+        blocks.pop()
+    return QuizSet(blocks[:num_questions], topic, level), tokens
+
+
+async def arepair_quiz(llm, quiz, num_questions, on_wait=None, explanations=True, seen=None):
+    """Replace only the invalid or missing questions of a parsed set.
+
+    Failing indices (see ``QuizSet.defects``) and any shortfall below
+    ``num_questions`` are requested in one follow-up that lists the valid
+    stems to avoid; valid replacements are merged back in place. Repeats up
+    to ``max_repairs`` times, then leaves any remaining defects as they are.
+    With ``seen`` (a ``dedup.StemIndex`` of the user's earlier questions),
+    near-repeats of those are replaced too and never accepted back.
+
+    Returns:
+        Tuple of the same ``QuizSet`` (modified in place) and the
+        completion tokens the follow-ups spent.
+    """
+    tokens = 0
+    for _ in range(Config.AI_CONFIG["max_repairs"]):
+        defects = quiz.defects(require_explanation=explanations)
+        repeats = {}
+        if seen is not None:
+            for i, q in enumerate(quiz.questions):
+                match = seen.match(q.stem)
+                if match is not None and i not in defects:
+                    repeats[i] = match
+        targets = sorted(set(defects) | set(repeats)) + list(range(len(quiz), num_questions))
+        if not targets:
+            break
+        kept = [q for i, q in enumerate(quiz.questions) if i not in defects and i not in repeats]
+        prompt = build_continuation_prompt(
+            quiz.topic, len(targets), quiz.level,
+            [q.stem for q in kept] + list(repeats.values()), explanations=explanations
+        )
+        started = time.perf_counter()
+        response = await alimited_call(
+            lambda: llm.ainvoke(prompt),
+            estimate_tokens(prompt, _max_tokens(llm)),
+            on_wait
+        )
+        metrics.observe("llm_repair", time.perf_counter() - started)
+        metrics.record_usage(response)
+        tokens += _usage_tokens(response) or 0
+
+        kept_words = [stem_words(q.stem) for q in kept]
+        for candidate in parse_response(_chunk_text(response)):
+            if not targets:
+                break
+            words = stem_words(candidate.stem)
+            if candidate.problems(explanations) or any(similarity(words, w) >= DUPLICATE_THRESHOLD for w in kept_words):
+                continue
+            if seen is not None and seen.match(candidate.stem) is not None:
+                continue
+            quiz.replace(targets.pop(0), candidate)
+            kept_words.append(words)
+            metrics.increment("repaired_questions_total")
+    return quiz, tokens
+
+
+async def agenerate_chunked(llm, topic, num_questions, level,
+                            chunk_size=None, max_concurrency=None, on_chunk=None, on_wait=None,
+                            explanations=True, avoid=None, routes=None):
+    """Generate a large set as concurrent chunks and merge the results.
+
+    Each chunk receives its own sub-focus so the model spreads coverage, and
+    a semaphore keeps at most ``max_concurrency`` requests in flight. With
+    ``explanations=False`` only questions, options and answers are requested
+    (see ``aexplain_questions`` for the second phase). ``avoid`` stems are
+    listed in every chunk's prompt. ``routes``, if given, is a set that
+    collects each chunk's ``HedgedLLM`` route (None without one).
+
+    Returns:
+        Tuple of the merged ``QuizSet`` and the completion tokens spent.
+    """
+    max_concurrency = max_concurrency or Config.AI_CONFIG["max_concurrency"]
+    sizes = plan_chunks(num_questions, chunk_size)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    done = 0
+    tokens = 0
+
+    async def run_chunk(index, size):
+        nonlocal done, tokens
+        focus = SUB_FOCUSES[index % len(SUB_FOCUSES)]
+        if len(sizes) > 1:
+            focus = f"{focus} (part {index + 1} of {len(sizes)})"
+        prompt = build_generation_prompt(topic, size, level, focus=focus, explanations=explanations, avoid=avoid)
+        async with semaphore:
+            started = time.perf_counter()
+            response = await alimited_call(
+                lambda: llm.ainvoke(prompt),
+                estimate_tokens(prompt, _max_tokens(llm)),
+                on_wait
+            )
+            metrics.observe("llm_call", time.perf_counter() - started)
+            metrics.record_usage(response)
+            if routes is not None:
+                routes.add(_route(response))
+            text = _chunk_text(response)
+            chunk, extra = await acontinue_truncated(
+                llm, parse_response(text, topic, level), size,
+                _finish_reason(response), focus, on_wait, explanations, is_json_output(text)
+            )
+        done += 1
+        tokens += (_usage_tokens(response) or 0) + extra
+        if on_chunk:
+            on_chunk(done, len(sizes))
+        return chunk.questions
+
+    results = await asyncio.gather(*(run_chunk(i, size) for i, size in enumerate(sizes)))
+    return QuizSet(merge_questions(results)[:num_questions], topic, level), tokens
+
+
+async def aexplain_questions(llm, quiz, indices=None, on_wait=None):
+    """Fill in missing explanations for questions generated without them.
+
+    Questions (all, or just ``indices``) lacking an explanation are sent in
+    batches of ``explanation_batch_size`` running concurrently; each reply
+    is written straight into the ``QuizSet``. ``llm`` should be sized with
+    ``explanation_budget``. When a reply hits its token limit the last
+    explanation is dropped as cut off and stays missing for a later retry.
+
+    Returns:
+        The completion tokens spent.
+    """
+    candidates = range(len(quiz)) if indices is None else indices
+    pending = [i for i in candidates if not quiz.questions[i].explanation.strip()]
+    size = Config.AI_CONFIG["explanation_batch_size"]
+    semaphore = asyncio.Semaphore(Config.AI_CONFIG["max_concurrency"])
+
+    async def run_batch(batch):
+        prompt = build_explanation_prompt(quiz.topic, quiz.level, [(i + 1, quiz.questions[i]) for i in batch])
+        async with semaphore:
+            started = time.perf_counter()
+            response = await alimited_call(
+                lambda: llm.ainvoke(prompt),
+                estimate_tokens(prompt, _max_tokens(llm)),
+                on_wait
+            )
+            metrics.observe("llm_explain", time.perf_counter() - started)
+            metrics.record_usage(response)
+        explanations = parse_explanations(_chunk_text(response))
+        if _finish_reason(response) == "length" and explanations:
+            explanations.pop(next(reversed(explanations)))
+        for i in batch:
+            if explanations.get(i + 1):
+                quiz.questions[i].explanation = explanations[i + 1]
+        return _usage_tokens(response) or 0
+
+    batches = [pending[i:i + size] for i in range(0, len(pending), size)]
+    return sum(await asyncio.gather(*(run_batch(batch) for batch in batches)))
+
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _background_loop():
+    """One event loop per process, so cached clients keep a single async pool."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="llm-event-loop", daemon=True).start()
+        return _loop
+
+
+def run_async(coro, updates=None):
+    """Run ``coro`` on the shared loop and block until it finishes.
+
+    ``(callback, args)`` pairs put on ``updates`` by the coroutine are
+    invoked in the calling thread, which is where Streamlit widgets must be
+    touched.
+    """
+    future = asyncio.run_coroutine_threadsafe(coro, _background_loop())
+    if updates is None:
+        return future.result()
+    while not (future.done() and updates.empty()):
+        try:
+            callback, args = updates.get(timeout=0.05)
+        except queue.Empty:
+            continue
+        callback(*args)
+    return future.result()
+
+
+def relay(updates, callback):
+    """Wrap ``callback`` so calls from the loop thread run in the caller's thread."""
+    if callback is None:
+        return None
+    return lambda *args: updates.put((callback, args))
+
+
+def continue_truncated(llm, quiz, num_questions,
+                       finish_reason=None, on_wait=None, explanations=True, json_reply=False):
+    """Blocking wrapper around ``acontinue_truncated`` for the Streamlit thread."""
+    updates = queue.Queue()
+    coro = acontinue_truncated(
+        llm, quiz, num_questions,
+        finish_reason=finish_reason,
+        on_wait=relay(updates, on_wait),
+        explanations=explanations,
+        json_reply=json_reply
+    )
+    return run_async(coro, updates)
+
+
+def repair_quiz(llm, quiz, num_questions, on_wait=None, explanations=True, seen=None):
+    """Blocking wrapper around ``arepair_quiz`` for the Streamlit thread."""
+    updates = queue.Queue()
+    coro = arepair_quiz(llm, quiz, num_questions, relay(updates, on_wait), explanations, seen)
+    return run_async(coro, updates)
+
+
+def explain_questions(llm, quiz, indices=None, on_wait=None):
+    """Blocking wrapper around ``aexplain_questions``; returns the tokens spent."""
+    updates = queue.Queue()
+    return run_async(aexplain_questions(llm, quiz, indices, relay(updates, on_wait)), updates)
+
+
+def start_explanations(llm, quiz):
+    """Begin ``aexplain_questions`` in the background and return its future.
+
+    The questions can be shown immediately; explanations appear in the
+    ``QuizSet`` as batches finish and ``future.result()`` gives the tokens.
+    """
+    return asyncio.run_coroutine_threadsafe(aexplain_questions(llm, quiz), _background_loop())
+
+
+def generate_chunked(llm, topic, num_questions, level, on_chunk=None, on_wait=None, **kwargs):
+    """Blocking wrapper around ``agenerate_chunked`` for the Streamlit thread."""
+    updates = queue.Queue()
+    coro = agenerate_chunked(
+        llm, topic, num_questions, level,
+        on_chunk=relay(updates, on_chunk),
+        on_wait=relay(updates, on_wait),
+        **kwargs
+    )
+    return run_async(coro, updates)
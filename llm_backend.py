@@ -0,0 +1,411 @@
+"""
+EduQuiz Pro LLM Backends
+Selects the chat model used for generation: Groq in production, or a
+deterministic local stand-in for benchmarks and offline development.
+
+Set ``LLM_BACKEND=mock`` to run the app without a Groq API key.
+"""
+
+import asyncio
+import json
+import queue
+import random
+import re
+import threading
+import time
+
+from config import Config
+from rate_limiter import estimate_tokens, get_limiter
+import metrics
+
+COUNT_RE = re.compile(r"EXACTLY (\d+)")
+TOPIC_RE = re.compile(r"(?:GENERATE \d+ QUESTIONS ABOUT|Topic): (.+)")
+FOCUS_RE = re.compile(r"Focus this set on: (.+)")
+# Questions-only prompts (text or JSON schema without an "e" field)
+NO_EXPLANATION_RE = re.compile(r'Do NOT include explanations|"a":0\}')
+EXPLAIN_RE = re.compile(r"EXPLAIN THESE \d+ QUESTIONS")
+NUMBERED_RE = re.compile(r"^(\d+)\. ", re.MULTILINE)
+
+# Vocabulary for varied stems, so validation does not see templated near-duplicates
+STEM_WORDS = (
+    ["primary", "hidden", "measured", "limiting", "observed", "expected", "central", "initial"],
+    ["role", "effect", "structure", "purpose", "cause", "pattern", "behaviour", "function"],
+    ["energy", "signals", "transport", "regulation", "growth", "balance", "storage", "exchange"],
+)
+
+
+def sample_mcq_text(num_questions, topic="Cell Biology", focus=None, explanations=True):
+    """Build LLM-style MCQ text with the layout requested by build_prompt."""
+    about = f"{topic} ({focus})" if focus else topic
+    offsets = [random.Random(f"{about}|{n}").randrange(8) for n in range(len(STEM_WORDS))]
+    blocks = []
+    for i in range(1, num_questions + 1):
+        # Odd strides make every word differ between questions of one response
+        aspect = " ".join(
+            words[(offset + i * (2 * n + 3)) % len(words)]
+            for n, (words, offset) in enumerate(zip(STEM_WORDS, offsets))
+        )
+        block = (
+            f"{i}. Which statement best describes the {aspect} of concept {i} in {about}?\n"
+            f"A) The first plausible description of concept {i}\n"
+            f"B) The correct description of concept {i}\n"
+            f"C) A common misconception about concept {i}\n"
+            f"D) An unrelated statement about {topic}\n"
+            f"\n"
+            f"Answer: B"
+        )
+        if explanations:
+            block += (
+                f"\nExplanation: Concept {i} is described by option B because it matches "
+                f"the accepted definition used throughout {topic}."
+            )
+        blocks.append(block)
+    return f"Here are {num_questions} questions about {topic}:\n\n" + "\n\n".join(blocks)
+
+
+def sample_mcq_json(num_questions, topic="Cell Biology", focus=None, explanations=True):
+    """The same questions as ``sample_mcq_text`` in the compact JSON schema."""
+    from quiz import OPTION_LETTERS, parse_quiz
+
+    items = []
+    for q in parse_quiz(sample_mcq_text(num_questions, topic, focus)):
+        item = {"s": q.stem, "o": q.options, "a": OPTION_LETTERS.index(q.answer)}
+        if explanations:
+            item["e"] = q.explanation
+        items.append(item)
+    return json.dumps({"q": items}, ensure_ascii=False)
+
+
+def sample_explanations(numbers, json_mode=False):
+    """Explanation reply for the numbered questions of an explanation prompt."""
+    explanations = {
+        n: f"Option B is correct for question {n} because it states the accepted definition."
+        for n in numbers
+    }
+    if json_mode:
+        return json.dumps({"e": {str(n): text for n, text in explanations.items()}})
+    return "\n".join(f"{n}. Explanation: {text}" for n, text in explanations.items())
+
+
+class MockAPIError(Exception):
+    """Injected failure carrying an HTTP status like the Groq client errors."""
+
+    def __init__(self, status_code):
+        super().__init__(f"Mock API error {status_code}")
+        self.status_code = status_code
+
+
+class MockMessage:
+    """Just enough of a LangChain AIMessage/AIMessageChunk for our callers."""
+
+    def __init__(self, content, output_tokens=None, finish_reason=None):
+        self.content = content
+        self.usage_metadata = {"output_tokens": output_tokens} if output_tokens is not None else {}
+        self.response_metadata = {"finish_reason": finish_reason} if finish_reason else {}
+
+
+class MockLLM:
+    """Local chat model returning realistic MCQ text with tunable timing.
+
+    Args:
+        ttft: Seconds before the first token.
+        tokens_per_sec: Generation speed after the first token.
+        failure_rate: Probability (0-1) that a call raises ``MockAPIError``.
+        failure_status: HTTP status used for injected failures.
+        max_tokens: Completion limit; longer answers are cut off mid-text.
+        seed: Seed for the failure RNG so runs are reproducible.
+        json_mode: Reply in the compact JSON schema instead of text.
+        slow_rate: Probability (0-1) that a call stalls for ``slow_ttft``
+            before its first token, like an overloaded upstream.
+        slow_ttft: Seconds to first token for those slow calls.
+    """
+
+    def __init__(self, ttft=0.3, tokens_per_sec=250.0, failure_rate=0.0,
+                 failure_status=429, max_tokens=2000, seed=0, model_name="mock", json_mode=False,
+                 slow_rate=0.0, slow_ttft=5.0):
+        self.ttft = ttft
+        self.tokens_per_sec = tokens_per_sec
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.slow_rate = slow_rate
+        self.slow_ttft = slow_ttft
+        self.max_tokens = max_tokens
+        self.model_name = model_name
+        self.json_mode = json_mode
+        # Per-model stream, so a primary and its fallback do not stall in lockstep
+        self._random = random.Random(f"{seed}|{model_name}")
+
+    def _respond(self, prompt):
+        if self.failure_rate and self._random.random() < self.failure_rate:
+            raise MockAPIError(self.failure_status)
+        if EXPLAIN_RE.search(prompt):
+            text = sample_explanations([int(n) for n in NUMBERED_RE.findall(prompt)], self.json_mode)
+        else:
+            count = COUNT_RE.search(prompt)
+            topic = TOPIC_RE.search(prompt)
+            focus = FOCUS_RE.search(prompt)
+            sample = sample_mcq_json if self.json_mode else sample_mcq_text
+            text = sample(
+                int(count.group(1)) if count else Config.AI_CONFIG["default_questions"],
+                topic.group(1).strip() if topic else "General Knowledge",
+                focus.group(1).strip() if focus else None,
+                explanations=not NO_EXPLANATION_RE.search(prompt)
+            )
+        # ~4 characters per token, like the estimate used for rate limiting
+        tokens = [text[i:i + 4] for i in range(0, len(text), 4)]
+        finish_reason = "stop"
+        if len(tokens) > self.max_tokens:
+            tokens = tokens[:self.max_tokens]
+            finish_reason = "length"
+        slow = self.slow_rate and self._random.random() < self.slow_rate
+        return tokens, finish_reason, self.slow_ttft if slow else self.ttft
+
+    def _duration(self, ttft, n_tokens):
+        return ttft + n_tokens / self.tokens_per_sec
+
+    def invoke(self, prompt):
+        tokens, finish_reason, ttft = self._respond(prompt)
+        time.sleep(self._duration(ttft, len(tokens)))
+        return MockMessage("".join(tokens), len(tokens), finish_reason)
+
+    async def ainvoke(self, prompt):
+        tokens, finish_reason, ttft = self._respond(prompt)
+        await asyncio.sleep(self._duration(ttft, len(tokens)))
+        return MockMessage("".join(tokens), len(tokens), finish_reason)
+
+    def stream(self, prompt, batch=8):
+        tokens, finish_reason, ttft = self._respond(prompt)
+        time.sleep(ttft)
+        for i in range(0, len(tokens), batch):
+            time.sleep(len(tokens[i:i + batch]) / self.tokens_per_sec)
+            yield MockMessage("".join(tokens[i:i + batch]))
+        yield MockMessage("", len(tokens), finish_reason)
+
+    async def astream(self, prompt, batch=8):
+        tokens, finish_reason, ttft = self._respond(prompt)
+        await asyncio.sleep(ttft)
+        for i in range(0, len(tokens), batch):
+            await asyncio.sleep(len(tokens[i:i + batch]) / self.tokens_per_sec)
+            yield MockMessage("".join(tokens[i:i + batch]))
+        yield MockMessage("", len(tokens), finish_reason)
+
+
+def choose_model(num_questions, level, stats=None):
+    """Pick the model for a request under ``Config.ROUTING``.
+
+    Sets no larger than ``small_max_questions[level]`` go to the small model,
+    everything else (and all Hard sets by default) to the main model. Once
+    both models have ``min_samples`` generations of this request's size in
+    ``stats`` (``auth.get_model_stats(num_questions)``), a small model that
+    is observed to be no faster at that size than the main one is skipped.
+    Per-question averages are not compared: the small model only ever sees
+    small sets, where fixed latency dominates.
+    """
+    large = Config.AI_CONFIG["model_name"]
+    routing = Config.ROUTING
+    small = routing["small_model"]
+    if not routing["enabled"] or num_questions > routing["small_max_questions"].get(level, 0):
+        return large
+    small_stats = (stats or {}).get(small)
+    large_stats = (stats or {}).get(large)
+    if (small_stats and large_stats
+            and min(small_stats.get("bucket_generations", 0),
+                    large_stats.get("bucket_generations", 0)) >= routing["min_samples"]
+            and small_stats["bucket_avg_latency"] >= large_stats["bucket_avg_latency"]):
+        return large
+    return small
+
+
+def estimate_cost(model, tokens):
+    """USD estimate for ``tokens`` completion tokens on ``model`` (0 if unpriced)."""
+    return tokens * Config.ROUTING["token_prices"].get(model, 0.0) / 1_000_000
+
+
+class HedgedLLM:
+    """Routes each call to a primary model with a secondary as hedge and fallback.
+
+    If the primary has not answered within ``hedge_after`` seconds (or, for
+    streams, produced its first chunk within ``hedge_ttft_after``), the same
+    prompt is sent to the secondary and whichever succeeds first wins; the
+    loser is cancelled (or its stream closed). An error from one model falls
+    back to the other straight away. The winning route ("primary", "hedge"
+    or "fallback") is counted in ``metrics`` and added to the response's
+    ``response_metadata["route"]``.
+
+    Callers put the whole call under ``limited_call``, which only pays for
+    the primary request, so every secondary request takes its own slot from
+    the shared limiter first.
+    """
+
+    def __init__(self, primary, secondary, hedge_after=None, hedge_ttft_after=None):
+        self.primary = primary
+        self.secondary = secondary
+        self.hedge_after = hedge_after
+        self.hedge_ttft_after = hedge_ttft_after
+
+    def __getattr__(self, name):
+        # max_tokens, model_name, json_mode... come from the primary model
+        return getattr(self.primary, name)
+
+    def _secondary_tokens(self, prompt):
+        return estimate_tokens(prompt, getattr(self.secondary, "max_tokens", None))
+
+    async def _asecondary(self, prompt):
+        await get_limiter().aacquire(1, self._secondary_tokens(prompt))
+        return await self.secondary.ainvoke(prompt)
+
+    @staticmethod
+    def _won(message, route, model):
+        metrics.increment(f"llm_route_{route}_total")
+        metadata = getattr(message, "response_metadata", None)
+        if isinstance(metadata, dict):
+            metadata["route"] = route
+            metadata.setdefault("model_name", getattr(model, "model_name", None))
+        return message
+
+    async def ainvoke(self, prompt):
+        tasks = {asyncio.ensure_future(self.primary.ainvoke(prompt)): ("primary", self.primary)}
+        pending = set(tasks)
+        errors = []
+        second_sent = False
+        try:
+            while True:
+                timeout = None if second_sent else self.hedge_after
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        route, model = tasks[task]
+                        return self._won(task.result(), route, model)
+                    errors.append(task.exception())
+                if not second_sent:
+                    second_sent = True
+                    route = "fallback" if done else "hedge"
+                    task = asyncio.ensure_future(self._asecondary(prompt))
+                    tasks[task] = (route, self.secondary)
+                    pending.add(task)
+                elif not pending:
+                    raise errors[0]
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _race(self, prompt, call, timeout, discard=None):
+        """Thread-based ``ainvoke`` logic for the blocking ``invoke``/``stream``."""
+        results = queue.Queue()
+        lock = threading.Lock()
+        winner = []
+
+        def run(model, route):
+            try:
+                if model is self.secondary:
+                    get_limiter().acquire(1, self._secondary_tokens(prompt))
+                result, error = call(model), None
+            except Exception as e:
+                result, error = None, e
+            with lock:
+                late = bool(winner) and error is None
+            if late and discard:
+                discard(result)
+            else:
+                results.put((route, model, result, error))
+
+        def launch(model, route):
+            threading.Thread(target=run, args=(model, route), name=f"llm-{route}", daemon=True).start()
+
+        launch(self.primary, "primary")
+        errors = []
+        second_sent = False
+        outstanding = 1
+        while True:
+            try:
+                route, model, result, error = results.get(timeout=None if second_sent else timeout)
+            except queue.Empty:
+                route = None
+            if route is not None:
+                outstanding -= 1
+                if error is None:
+                    with lock:
+                        winner.append(route)
+                    # A loser that finished at the same moment is already queued
+                    while discard and not results.empty():
+                        _, _, other, other_error = results.get_nowait()
+                        if other_error is None:
+                            discard(other)
+                    return self._won_result(result, route, model)
+                errors.append(error)
+            if not second_sent:
+                second_sent = True
+                outstanding += 1
+                launch(self.secondary, "hedge" if route is None else "fallback")
+            elif outstanding == 0:
+                raise errors[0]
+
+    def _won_result(self, result, route, model):
+        if isinstance(result, tuple):  # (first chunk, rest) from a stream
+            first, rest = result
+            if first is not None:
+                self._won(first, route, model)
+            else:
+                metrics.increment(f"llm_route_{route}_total")
+            return result
+        return self._won(result, route, model)
+
+    def invoke(self, prompt):
+        return self._race(prompt, lambda model: model.invoke(prompt), self.hedge_after)
+
+    def stream(self, prompt):
+        def open_stream(model):
+            iterator = iter(model.stream(prompt))
+            return next(iterator, None), iterator
+
+        def close(result):
+            close_stream = getattr(result[1], "close", None)
+            if close_stream:
+                close_stream()
+
+        first, rest = self._race(prompt, open_stream, self.hedge_ttft_after, discard=close)
+        if first is not None:
+            yield first
+        yield from rest
+
+
+def create_llm(api_key=None, model_name=None, max_tokens=2000, temperature=0.7, backend=None,
+               json_mode=None, hedged=None):
+    """Build the chat model for the configured backend ("groq" or "mock").
+
+    ``json_mode`` defaults to the configured output format and turns on
+    Groq's JSON object response format. With a ``fallback_model``
+    configured (and ``hedged`` not False) the model is wrapped in a
+    ``HedgedLLM`` that hedges slow calls and falls back on errors.
+    """
+    backend = backend or Config.AI_CONFIG["backend"]
+    model_name = model_name or Config.AI_CONFIG["model_name"]
+    if json_mode is None:
+        json_mode = Config.AI_CONFIG["output_format"] == "json"
+    fallback_model = Config.AI_CONFIG["fallback_model"]
+    if fallback_model == model_name:
+        # A request routed to the fallback model backs up onto the main one
+        fallback_model = Config.AI_CONFIG["model_name"]
+    if hedged is None:
+        hedged = bool(fallback_model) and fallback_model != model_name
+    if hedged:
+        return HedgedLLM(
+            create_llm(api_key, model_name, max_tokens, temperature, backend, json_mode, hedged=False),
+            create_llm(api_key, fallback_model, max_tokens, temperature, backend, json_mode, hedged=False),
+            hedge_after=Config.AI_CONFIG["hedge_after"],
+            hedge_ttft_after=Config.AI_CONFIG["hedge_ttft_after"]
+        )
+    if backend == "mock":
+        return MockLLM(max_tokens=max_tokens, model_name=model_name, json_mode=json_mode, **Config.MOCK_LLM)
+    if backend != "groq":
+        raise ValueError(f"Unknown LLM backend: {backend}")
+
+    from langchain_groq import ChatGroq
+
+    return ChatGroq(
+        model=model_name,
+        api_key=api_key,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        model_kwargs={"response_format": {"type": "json_object"}} if json_mode else {}
+    )
@@ -0,0 +1,226 @@
+"""
+EduQuiz Pro Metrics
+Lightweight per-stage latency and token instrumentation.
+
+Samples are kept in an in-memory ring buffer per stage (for live
+percentiles), periodically flushed to SQLite once ``start()`` has run (for
+history, pruned after ``retention`` seconds), and exposed in Prometheus
+text format on ``Config.METRICS["port"]``.
+"""
+
+import functools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import Config
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class StageMetrics:
+    """Recent samples plus lifetime count/sum for one instrumented stage."""
+
+    __slots__ = ("samples", "count", "total")
+
+    def __init__(self, size):
+        self.samples = deque(maxlen=size)
+        self.count = 0
+        self.total = 0.0
+
+    def quantile(self, q):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class MetricsRegistry:
+    def __init__(self, buffer_size=None):
+        self.buffer_size = buffer_size or Config.METRICS["buffer_size"]
+        self._stages = {}
+        self._counters = {}
+        # Only filled while a flusher runs, and bounded in case flushes fail
+        self.persist = False
+        self._pending = deque(maxlen=Config.METRICS["max_pending"])
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            metrics = self._stages.get(stage)
+            if metrics is None:
+                metrics = self._stages[stage] = StageMetrics(self.buffer_size)
+            metrics.samples.append(seconds)
+            metrics.count += 1
+            metrics.total += seconds
+            if self.persist:
+                self._pending.append((stage, time.time(), seconds))
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def snapshot(self):
+        """Per-stage summary rows for dashboards."""
+        with self._lock:
+            return [
+                {
+                    "stage": stage,
+                    "count": m.count,
+                    "avg_ms": m.total / m.count * 1000 if m.count else 0.0,
+                    **{f"p{int(q * 100)}_ms": m.quantile(q) * 1000 for q in QUANTILES},
+                }
+                for stage, m in sorted(self._stages.items())
+            ], dict(self._counters)
+
+    def prometheus(self):
+        """Render all metrics in the Prometheus text exposition format."""
+        lines = [
+            "# HELP eduquiz_stage_seconds Latency of instrumented stages.",
+            "# TYPE eduquiz_stage_seconds summary",
+        ]
+        with self._lock:
+            for stage, m in sorted(self._stages.items()):
+                for q in QUANTILES:
+                    lines.append(f'eduquiz_stage_seconds{{stage="{stage}",quantile="{q}"}} {m.quantile(q):.6f}')
+                lines.append(f'eduquiz_stage_seconds_sum{{stage="{stage}"}} {m.total:.6f}')
+                lines.append(f'eduquiz_stage_seconds_count{{stage="{stage}"}} {m.count}')
+            for name, value in sorted(self._counters.items()):
+                lines.append(f"# TYPE eduquiz_{name} counter")
+                lines.append(f"eduquiz_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def flush(self):
+        """Persist samples recorded since the last flush and drop expired ones.
+
+        The ``metrics_samples`` table is created by ``auth.MIGRATIONS``.
+        """
+        with self._lock:
+            pending = list(self._pending)
+            self._pending.clear()
+        if not pending:
+            return 0
+        from db import get_pool
+
+        with get_pool().connection() as conn:
+            conn.executemany(
+                "INSERT INTO metrics_samples (stage, recorded_at, seconds) VALUES (?, ?, ?)",
+                pending
+            )
+            conn.execute(
+                "DELETE FROM metrics_samples WHERE recorded_at < ?",
+                (time.time() - Config.METRICS["retention"],)
+            )
+        return len(pending)
+
+
+registry = MetricsRegistry()
+
+
+def observe(stage, seconds):
+    registry.observe(stage, seconds)
+
+
+def increment(name, amount=1):
+    registry.increment(name, amount)
+
+
+def record_usage(message):
+    """Count prompt/completion tokens reported on an LLM response."""
+    usage = getattr(message, "usage_metadata", None) or {}
+    if usage.get("input_tokens"):
+        increment("llm_prompt_tokens_total", usage["input_tokens"])
+    if usage.get("output_tokens"):
+        increment("llm_completion_tokens_total", usage["output_tokens"])
+
+
+@contextmanager
+def track(stage):
+    """Context manager recording the wall time of a block."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started)
+
+
+def timed(stage):
+    """Decorator recording the wall time of every call."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with track(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def history(since_seconds=24 * 3600):
+    """Flushed samples newer than ``since_seconds`` ago, grouped by stage."""
+    from db import get_pool
+
+    registry.flush()
+    grouped = {}
+    with get_pool().connection() as conn:
+        try:
+            rows = conn.execute(
+                "SELECT stage, recorded_at, seconds FROM metrics_samples "
+                "WHERE recorded_at >= ? ORDER BY recorded_at",
+                (time.time() - since_seconds,)
+            ).fetchall()
+        except Exception:
+            return grouped  # nothing flushed yet
+    for stage, recorded_at, seconds in rows:
+        grouped.setdefault(stage, []).append((recorded_at, seconds))
+    return grouped
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # keep scrapes out of the Streamlit log
+
+
+_started = False
+_start_lock = threading.Lock()
+
+
+def _flush_forever(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            registry.flush()
+        except Exception as e:
+            print(f"Metrics flush failed: {e}")
+
+
+def start():
+    """Start the flusher and Prometheus endpoint once per process."""
+    global _started
+    with _start_lock:
+        if _started or not Config.METRICS["enabled"]:
+            return
+        _started = True
+        registry.persist = True
+    threading.Thread(
+        target=_flush_forever, args=(Config.METRICS["flush_interval"],),
+        name="metrics-flush", daemon=True
+    ).start()
+    try:
+        server = ThreadingHTTPServer(("0.0.0.0", Config.METRICS["port"]), _MetricsHandler)
+    except OSError as e:
+        print(f"Metrics endpoint disabled: {e}")
+        return
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
@@ -0,0 +1,139 @@
+"""
+EduQuiz Pro Admin Dashboard
+Per-stage latency percentiles and token counters for operators.
+
+Visible to accounts listed in the ADMIN_EMAILS environment variable.
+"""
+
+import streamlit as st
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from config import Config
+from bootstrap import initialize, get_css
+from cache import get_cache
+from auth import get_model_stats, count_questions
+from llm_backend import estimate_cost
+import metrics
+
+st.set_page_config(**Config.UI_CONFIG)
+
+if not initialize():
+    st.error("❌ Configuration validation failed. Please check your setup.")
+    st.stop()
+
+st.markdown(get_css(), unsafe_allow_html=True)
+
+if not st.session_state.get("logged_in"):
+    st.warning("🔒 Please log in first.")
+    st.stop()
+if st.session_state.user not in Config.SECURITY["admin_emails"]:
+    st.error("❌ This page is restricted to administrators.")
+    st.stop()
+
+st.markdown('<h1 class="main-header">📈 Performance Dashboard</h1>', unsafe_allow_html=True)
+st.caption(
+    f"Live figures cover the last {Config.METRICS['buffer_size']} samples per stage in this process. "
+    f"Prometheus scrape endpoint: port {Config.METRICS['port']}, path /metrics."
+)
+
+rows, counters = metrics.registry.snapshot()
+
+col1, col2, col3, col4 = st.columns(4)
+with col1:
+    llm_calls = next((row["count"] for row in rows if row["stage"] == "llm_call"), 0)
+    st.metric("LLM Calls", llm_calls)
+with col2:
+    st.metric("Prompt Tokens", f"{counters.get('llm_prompt_tokens_total', 0):,}")
+with col3:
+    st.metric("Completion Tokens", f"{counters.get('llm_completion_tokens_total', 0):,}")
+with col4:
+    st.metric(
+        "Calls Saved (coalesced)",
+        counters.get("singleflight_saved_calls_total", 0),
+        help="Requests that joined an identical in-flight generation instead of calling the LLM"
+    )
+
+st.markdown("### ⏱️ Stage Latency (live)")
+if rows:
+    st.dataframe(
+        [{key: round(value, 1) if isinstance(value, float) else value for key, value in row.items()}
+         for row in rows],
+        use_container_width=True,
+        hide_index=True
+    )
+else:
+    st.info("No samples recorded yet. Generate a quiz to populate the dashboard.")
+
+st.markdown("### 🧭 Model Routes")
+model_stats = get_model_stats()
+if model_stats:
+    st.dataframe(
+        [
+            {
+                "model": model,
+                "generations": s["generations"],
+                "questions": s["questions"],
+                "avg_latency_s": round(s["avg_latency"], 2),
+                "s_per_question": round(s["sec_per_question"], 3),
+                "tokens_per_question": round(s["tokens"] / s["questions"], 1) if s["questions"] else 0,
+                "est_cost_usd": round(estimate_cost(model, s["tokens"]), 4),
+            }
+            for model, s in sorted(model_stats.items())
+        ],
+        use_container_width=True,
+        hide_index=True
+    )
+    st.caption(
+        f"Auto routing sends up to {Config.ROUTING['small_max_questions']} questions per level to "
+        f"{Config.ROUTING['small_model']}; after {Config.ROUTING['min_samples']} generations per model "
+        f"observed latency can override that."
+    )
+else:
+    st.info("No generations recorded yet.")
+
+st.markdown("### 🗄️ Generation Cache")
+cache = get_cache()
+col1, col2, col3, col4, col5 = st.columns(5)
+with col1:
+    st.metric("Hit Rate", f"{cache.hit_rate():.0%}")
+with col2:
+    st.metric("Memory Hits", cache.stats["memory_hits"])
+with col3:
+    st.metric("Disk Hits", cache.stats["disk_hits"])
+with col4:
+    st.metric("Misses", cache.stats["misses"])
+with col5:
+    st.metric("Evictions", cache.stats["evictions"])
+
+st.markdown("### 📚 Question Bank")
+col1, col2 = st.columns(2)
+with col1:
+    st.metric("Stored Questions", f"{count_questions():,}")
+with col2:
+    st.metric(
+        "Questions Reused",
+        counters.get("bank_questions_served_total", 0),
+        help="Questions served from the bank instead of being generated (this process)"
+    )
+
+st.markdown("### 🕒 Last 24 Hours")
+grouped = metrics.history()
+if grouped:
+    stage = st.selectbox("Stage", sorted(grouped), index=sorted(grouped).index("llm_call") if "llm_call" in grouped else 0)
+    samples = [seconds * 1000 for _, seconds in grouped[stage]]
+    ordered = sorted(samples)
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Samples", len(samples))
+    with col2:
+        st.metric("p50", f"{ordered[len(ordered) // 2]:.1f} ms")
+    with col3:
+        st.metric("p95", f"{ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]:.1f} ms")
+    st.line_chart(samples[-500:])
+else:
+    st.info("No flushed samples yet.")
+
+with st.expander("Raw Prometheus output"):
+    st.code(metrics.registry.prometheus(), language="text")
@@ -1,160 +1,449 @@
 from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak
+from reportlab.platypus.tableofcontents import TableOfContents
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
-from reportlab.lib.colors import Color, black, white
 from reportlab.lib import colors
+import hashlib
+import multiprocessing
 import os
+import re
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
+from io import BytesIO
 
+from config import Config
+from metrics import timed
+from quiz import QuizSet, OPTION_LETTERS
+
+# Styles are immutable once built, so create them once per process
+_base_styles = getSampleStyleSheet()
+
+BODY_STYLE = _base_styles['Normal']
+
+TITLE_STYLE = ParagraphStyle(
+    'CustomTitle',
+    parent=_base_styles['Heading1'],
+    fontSize=24,
+    textColor=colors.HexColor('#2E86AB'),
+    spaceAfter=30,
+    alignment=1,  # Center alignment
+    fontName='Helvetica-Bold'
+)
+
+SUBTITLE_STYLE = ParagraphStyle(
+    'CustomSubtitle',
+    parent=_base_styles['Heading2'],
+    fontSize=14,
+    textColor=colors.HexColor('#666666'),
+    spaceAfter=20,
+    alignment=1,
+    fontName='Helvetica'
+)
+
+QUESTION_STYLE = ParagraphStyle(
+    'QuestionStyle',
+    parent=_base_styles['Normal'],
+    fontSize=12,
+    spaceAfter=12,
+    fontName='Helvetica-Bold',
+    textColor=colors.HexColor('#333333')
+)
+
+OPTION_STYLE = ParagraphStyle(
+    'OptionStyle',
+    parent=_base_styles['Normal'],
+    fontSize=11,
+    spaceAfter=6,
+    leftIndent=20,
+    fontName='Helvetica'
+)
+
+ANSWER_STYLE = ParagraphStyle(
+    'AnswerStyle',
+    parent=_base_styles['Normal'],
+    fontSize=10,
+    spaceAfter=15,
+    leftIndent=20,
+    fontName='Helvetica-Bold',
+    textColor=colors.HexColor('#2E86AB')
+)
+
+PART_STYLE = ParagraphStyle(
+    'PartStyle',
+    parent=_base_styles['Heading1'],
+    fontSize=18,
+    textColor=colors.HexColor('#2E86AB'),
+    spaceAfter=20,
+    fontName='Helvetica-Bold'
+)
+
+TOC_STYLE = ParagraphStyle(
+    'TOCEntry',
+    parent=_base_styles['Normal'],
+    fontSize=12,
+    leading=18,
+    fontName='Helvetica'
+)
+
+FOOTER_STYLE = ParagraphStyle(
+    'Footer',
+    parent=_base_styles['Normal'],
+    fontSize=8,
+    textColor=colors.HexColor('#999999'),
+    alignment=1
+)
+
+INFO_TABLE_STYLE = TableStyle([
+    ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor('#666666')),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#E0E0E0')),
+    ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#F8F9FA'))
+])
+
+KEY_TABLE_STYLE = TableStyle([
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#E0E0E0')),
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#F8F9FA'))
+])
+
+# Line classifiers for raw text; any question number is accepted
+QUESTION_LINE = re.compile(r"^(?:\d+\.|question)", re.IGNORECASE)
+OPTION_LINE = re.compile(r"^[A-Da-d][.)]")
+ANSWER_LINE = re.compile(r"(?:answer|correct|solution):", re.IGNORECASE)
+
+
+def _escape(text):
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+@timed("pdf_render")
 def save_pdf(content, filename="mcqs.pdf", topic="Generated MCQs", user_email=""):
+    """Render MCQs to a PDF file under outputs/ and return its path."""
     output_dir = "outputs"
     os.makedirs(output_dir, exist_ok=True)
-    
+
     # Generate timestamp-based filename if default
     if filename == "mcqs.pdf":
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"mcqs_{timestamp}.pdf"
 
     file_path = os.path.join(output_dir, filename)
+    _build_pdf(file_path, content, topic, user_email)
+    return file_path
 
-    # Create document with margins
-    doc = SimpleDocTemplate(
-        file_path, 
-        pagesize=A4,
-        rightMargin=72,
-        leftMargin=72,
-        topMargin=72,
-        bottomMargin=72
-    )
-    
-    # Get and customize styles
-    styles = getSampleStyleSheet()
-    
-    # Custom styles
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=colors.HexColor('#2E86AB'),
-        spaceAfter=30,
-        alignment=1,  # Center alignment
-        fontName='Helvetica-Bold'
-    )
-    
-    subtitle_style = ParagraphStyle(
-        'CustomSubtitle',
-        parent=styles['Heading2'],
-        fontSize=14,
-        textColor=colors.HexColor('#666666'),
-        spaceAfter=20,
-        alignment=1,
-        fontName='Helvetica'
-    )
-    
-    question_style = ParagraphStyle(
-        'QuestionStyle',
-        parent=styles['Normal'],
-        fontSize=12,
-        spaceAfter=12,
-        fontName='Helvetica-Bold',
-        textColor=colors.HexColor('#333333')
-    )
-    
-    option_style = ParagraphStyle(
-        'OptionStyle',
-        parent=styles['Normal'],
-        fontSize=11,
-        spaceAfter=6,
-        leftIndent=20,
-        fontName='Helvetica'
-    )
-    
-    answer_style = ParagraphStyle(
-        'AnswerStyle',
-        parent=styles['Normal'],
-        fontSize=10,
-        spaceAfter=15,
-        leftIndent=20,
-        fontName='Helvetica-Bold',
-        textColor=colors.HexColor('#2E86AB')
+
+@timed("pdf_render")
+def render_pdf(content, topic="Generated MCQs", user_email="", include_answers=True, version=None):
+    """Render MCQs entirely in memory and return the PDF bytes.
+
+    ``include_answers=False`` leaves out answers and explanations (a student
+    copy); ``version`` labels an exam variant in the header.
+    """
+    buffer = BytesIO()
+    _build_pdf(buffer, content, topic, user_email, include_answers, version)
+    return buffer.getvalue()
+
+
+@timed("pdf_answer_key")
+def render_answer_key_pdf(variants, topic="Generated MCQs", user_email=""):
+    """One PDF with the answer key of every exam variant (see ``variants.py``)."""
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=72)
+    story = _header(f"Answer Key - {_escape(topic)}", topic, user_email)
+    for variant in variants:
+        story.append(Paragraph(f"Version {variant.label}", QUESTION_STYLE))
+        rows = [["Question", "Answer", "Master copy #"]]
+        rows.extend(
+            [str(position + 1), question.answer or "-", str(original + 1)]
+            for position, (question, original) in enumerate(zip(variant.quiz, variant.order))
+        )
+        table = Table(rows, colWidths=[1.5*inch, 1.5*inch, 1.5*inch], repeatRows=1)
+        table.setStyle(KEY_TABLE_STYLE)
+        story.append(table)
+        story.append(Spacer(1, 20))
+    doc.build(story)
+    return buffer.getvalue()
+
+
+def zip_pdfs(files):
+    """Zip ``(name, pdf_bytes)`` pairs in memory and return the archive bytes."""
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, pdf_bytes in files:
+            archive.writestr(name, pdf_bytes)
+    return buffer.getvalue()
+
+
+@timed("pdf_exam_pack")
+def render_exam_pack(variants, topic="Generated MCQs", user_email="", on_progress=None):
+    """Zip of a student copy per variant plus the combined answer key."""
+    papers = render_batch(
+        [variant.quiz for variant in variants],
+        topics=[topic] * len(variants),
+        user_email=user_email,
+        include_answers=False,
+        versions=[variant.label for variant in variants],
+        on_progress=on_progress
     )
-    
+    files = [(f"version_{variant.label}.pdf", paper) for variant, paper in zip(variants, papers)]
+    files.append(("answer_key.pdf", render_answer_key_pdf(variants, topic, user_email)))
+    return zip_pdfs(files)
+
+
+# ---- batch rendering ------------------------------------------------
+
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+
+def get_render_pool():
+    """Process pool shared by every batch render in this process."""
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            _render_pool = ProcessPoolExecutor(
+                max_workers=Config.PDF_RENDER["max_workers"],
+                mp_context=multiprocessing.get_context(Config.PDF_RENDER["start_method"])
+            )
+        return _render_pool
+
+
+def _reset_render_pool():
+    global _render_pool
+    with _render_pool_lock:
+        _render_pool = None
+
+
+def _render_job(job):
+    """Worker entry point: render one ``(quiz, topic, email, answers, version)`` job."""
+    buffer = BytesIO()
+    _build_pdf(buffer, *job)
+    return buffer.getvalue()
+
+
+@timed("pdf_render_batch")
+def render_batch(quizzes, topics=None, user_email="", include_answers=True, versions=None,
+                 on_progress=None, persist=False):
+    """Render one PDF per quiz across all CPU cores.
+
+    Jobs run in a shared ``ProcessPoolExecutor`` so ReportLab's CPU work
+    neither blocks the calling thread's interpreter nor stays on one core;
+    batches smaller than ``Config.PDF_RENDER["min_batch"]``, single-core
+    hosts and a broken pool render in-process instead.
+
+    Args:
+        quizzes: ``QuizSet`` objects (or raw text) to render.
+        topics: Title per quiz; defaults to each ``QuizSet.topic``.
+        versions: Optional version label per quiz (see ``variants.py``).
+        on_progress: Called as ``on_progress(done, total)`` in the calling
+            thread whenever a PDF finishes.
+        persist: Store each PDF under its content address and return paths.
+
+    Returns:
+        PDF bytes (or file paths with ``persist``) in input order.
+    """
+    topics = topics or [getattr(quiz, "topic", "") or "Generated MCQs" for quiz in quizzes]
+    versions = versions or [None] * len(quizzes)
+    jobs = [
+        (quiz, topic, user_email, include_answers, version)
+        for quiz, topic, version in zip(quizzes, topics, versions)
+    ]
+    results = [None] * len(jobs)
+    done = 0
+
+    def finished(index, pdf_bytes):
+        nonlocal done
+        results[index] = pdf_bytes
+        done += 1
+        if on_progress:
+            on_progress(done, len(jobs))
+
+    workers = Config.PDF_RENDER["max_workers"] or os.cpu_count() or 1
+    if len(jobs) >= Config.PDF_RENDER["min_batch"] and workers > 1:
+        try:
+            pool = get_render_pool()
+            futures = {pool.submit(_render_job, job): index for index, job in enumerate(jobs)}
+            for future in as_completed(futures):
+                finished(futures[future], future.result())
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); finish the rest here
+            _reset_render_pool()
+    for index, job in enumerate(jobs):
+        if results[index] is None:
+            finished(index, _render_job(job))
+
+    if persist:
+        return [persist_pdf(pdf_bytes, quiz, topic) for pdf_bytes, quiz, topic in zip(results, quizzes, topics)]
+    return results
+
+
+class _BookTemplate(SimpleDocTemplate):
+    """Feeds part headings to the table of contents and the PDF outline."""
+
+    def afterFlowable(self, flowable):
+        title = getattr(flowable, "toc_title", None)
+        if title:
+            key = f"part{flowable.toc_index}"
+            self.canv.bookmarkPage(key)
+            self.canv.addOutlineEntry(title, key, level=0)
+            self.notify("TOCEntry", (0, _escape(title), self.page, key))
+
+
+@timed("pdf_exam_book")
+def render_exam_book(quizzes, title="Exam Book", user_email="", include_answers=True):
+    """Render many quizzes into one PDF that opens with a shared table of contents.
+
+    Each set starts on a new page under a numbered part heading; the
+    contents page and the PDF outline link to every part.
+    """
+    buffer = BytesIO()
+    doc = _BookTemplate(buffer, pagesize=A4, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=72)
+    topics = ", ".join(dict.fromkeys(quiz.topic for quiz in quizzes if quiz.topic))
+    story = _header(_escape(title), topics or title, user_email)
+
+    toc = TableOfContents()
+    toc.levelStyles = [TOC_STYLE]
+    story.append(Paragraph("Contents", QUESTION_STYLE))
+    story.append(toc)
+
+    for index, quiz in enumerate(quizzes, start=1):
+        story.append(PageBreak())
+        details = ", ".join(part for part in (quiz.level, f"{len(quiz)} questions") if part)
+        heading = f"Part {index}: {quiz.topic or 'Untitled'} ({details})"
+        part = Paragraph(_escape(heading), PART_STYLE)
+        part.toc_title = heading
+        part.toc_index = index
+        story.append(part)
+        _add_quiz(story, quiz, include_answers)
+
+    story.append(Spacer(1, 50))
+    story.append(Paragraph("Generated by EduQuiz Pro - AI-Powered MCQ Generator", FOOTER_STYLE))
+    # Extra passes let the contents page learn the final page numbers
+    doc.multiBuild(story)
+    return buffer.getvalue()
+
+
+def content_address(content, topic):
+    """Stable name for a quiz so identical sets map to one stored file."""
+    body = content.to_json() if isinstance(content, QuizSet) else content
+    digest = hashlib.sha256(f"{topic}\n{body}".encode()).hexdigest()
+    return f"{Config.STORAGE['pdf_prefix']}{digest[:32]}.pdf"
+
+
+def persist_pdf(pdf_bytes, content, topic):
+    """Store rendered bytes under their content address; skip if already there."""
+    output_dir = Config.STORAGE["output_dir"]
+    os.makedirs(output_dir, exist_ok=True)
+    file_path = os.path.join(output_dir, content_address(content, topic))
+    if not os.path.exists(file_path):
+        fd, tmp_path = tempfile.mkstemp(dir=output_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(pdf_bytes)
+        os.replace(tmp_path, file_path)
+    return file_path
+
+
+def _header(subtitle, topic, user_email, version=None):
+    """Title, subtitle and info table that open every document."""
     story = []
-    
-    # Header
-    story.append(Paragraph("🎓 EduQuiz Pro", title_style))
-    story.append(Paragraph(f"Multiple Choice Questions - {topic}", subtitle_style))
-    
-    # Info table
+    story.append(Paragraph("🎓 EduQuiz Pro", TITLE_STYLE))
+    story.append(Paragraph(subtitle, SUBTITLE_STYLE))
+
     current_time = datetime.now().strftime("%B %d, %Y at %I:%M %p")
     info_data = [
         ['Generated on:', current_time],
         ['Generated for:', user_email.split('@')[0].title() if user_email else 'User'],
         ['Topic:', topic]
     ]
-    
+    if version:
+        info_data.append(['Version:', version])
+
     info_table = Table(info_data, colWidths=[2*inch, 4*inch])
-    info_table.setStyle(TableStyle([
-        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor('#666666')),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#E0E0E0')),
-        ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#F8F9FA'))
-    ]))
-    
+    info_table.setStyle(INFO_TABLE_STYLE)
+
     story.append(info_table)
     story.append(Spacer(1, 30))
-    
-    # Process content
-    lines = content.split('\n')
-    current_question = ""
-    
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-            
-        # Clean up line for PDF
-        line = line.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
-        
-        # Detect question (usually starts with number or "Question")
-        if (line.startswith(('1.', '2.', '3.', '4.', '5.', '6.', '7.', '8.', '9.', '10.')) or 
-            line.lower().startswith('question') or
-            any(line.startswith(f'{i}.') for i in range(11, 21))):
-            if current_question:  # Add space before new question
-                story.append(Spacer(1, 20))
-            story.append(Paragraph(line, question_style))
-            current_question = line
-            
-        # Detect options (A, B, C, D or a), b), c), d))
-        elif (line.startswith(('A)', 'B)', 'C)', 'D)', 'a)', 'b)', 'c)', 'd)')) or
-              line.startswith(('A.', 'B.', 'C.', 'D.', 'a.', 'b.', 'c.', 'd.'))):
-            story.append(Paragraph(line, option_style))
-            
-        # Detect answers (usually contains "Answer:" or "Correct:")
-        elif any(keyword in line.lower() for keyword in ['answer:', 'correct:', 'solution:']):
-            story.append(Paragraph(line, answer_style))
-            
-        # Regular content
-        else:
-            story.append(Paragraph(line, styles['Normal']))
+    return story
+
+
+def _build_pdf(target, content, topic, user_email, include_answers=True, version=None):
+    """Lay out ``content`` (a QuizSet or raw LLM text) into a path or buffer."""
+    # Create document with margins
+    doc = SimpleDocTemplate(
+        target,
+        pagesize=A4,
+        rightMargin=72,
+        leftMargin=72,
+        topMargin=72,
+        bottomMargin=72
+    )
+
+    # Header
+    story = _header(f"Multiple Choice Questions - {_escape(topic)}", topic, user_email, version)
+
+    if isinstance(content, QuizSet):
+        _add_quiz(story, content, include_answers)
+    else:
+        _add_text(story, content)
 
     # Footer
     story.append(Spacer(1, 50))
-    story.append(Paragraph(
-        "Generated by EduQuiz Pro - AI-Powered MCQ Generator", 
-        ParagraphStyle(
-            'Footer',
-            parent=styles['Normal'],
-            fontSize=8,
-            textColor=colors.HexColor('#999999'),
-            alignment=1
-        )
-    ))
+    story.append(Paragraph("Generated by EduQuiz Pro - AI-Powered MCQ Generator", FOOTER_STYLE))
 
     # Build PDF
     doc.build(story)
-    return file_path
+
+
+def _add_quiz(story, quiz, include_answers=True):
+    """Lay out an already-parsed quiz without any text sniffing."""
+    for index, question in enumerate(quiz):
+        if index:
+            story.append(Spacer(1, 20))
+        story.append(Paragraph(f"{question.number}. {_escape(question.stem)}", QUESTION_STYLE))
+        for letter, option in zip(OPTION_LETTERS, question.options):
+            story.append(Paragraph(f"{letter}) {_escape(option)}", OPTION_STYLE))
+        if not include_answers:
+            continue
+        if question.answer:
+            story.append(Paragraph(f"Answer: {question.answer}", ANSWER_STYLE))
+        if question.explanation:
+            story.append(Paragraph(f"Explanation: {_escape(question.explanation)}", BODY_STYLE))
+
+
+def _classify(line):
+    """Return the paragraph style for one stripped line of raw text."""
+    if QUESTION_LINE.match(line):
+        return QUESTION_STYLE
+    if OPTION_LINE.match(line):
+        return OPTION_STYLE
+    if ANSWER_LINE.search(line):
+        return ANSWER_STYLE
+    return BODY_STYLE
+
+
+def _add_text(story, content):
+    """Lay out raw LLM text using line heuristics (legacy history rows)."""
+    seen_question = False
+
+    for line in content.split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+
+        style = _classify(line)
+        if style is QUESTION_STYLE:
+            if seen_question:  # Add space before new question
+                story.append(Spacer(1, 20))
+            seen_question = True
+        story.append(Paragraph(_escape(line), style))
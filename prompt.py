@@ -1,11 +1,49 @@
-def build_prompt(topic, num_questions, level):
-    level_descriptions = {
-        "Easy": "basic concepts, definitions, and straightforward applications",
-        "Medium": "applied knowledge, analysis, and moderate problem-solving",
-        "Hard": "complex analysis, synthesis, evaluation, and advanced problem-solving"
-    }
-    
-    level_desc = level_descriptions.get(level, "appropriate for the selected level")
+from config import Config
+from metrics import timed
+from quiz import OPTION_LETTERS
+
+# Bump whenever the template text below changes so cached generations
+# produced by an older template are not served for the new one.
+# 2: compact JSON template and the avoid list
+PROMPT_VERSION = "2"
+
+LEVEL_DESCRIPTIONS = {
+    "Easy": "basic concepts, definitions, and straightforward applications",
+    "Medium": "applied knowledge, analysis, and moderate problem-solving",
+    "Hard": "complex analysis, synthesis, evaluation, and advanced problem-solving"
+}
+
+# Text-template pieces that depend on whether explanations are requested
+EXPLANATION_RULES = {
+    True: (
+        "\n- Include a clear, educational explanation for each correct answer",
+        '\n- Start explanations with "Explanation:"\n- Keep explanations concise but informative',
+        '\nExplanation: Mitochondria are known as the "powerhouses" of the cell because they produce ATP '
+        'through cellular respiration, providing energy for cellular processes.',
+    ),
+    False: (
+        "",
+        "\n- Do NOT include explanations; end each question at its Answer line",
+        "",
+    ),
+}
+
+
+def avoid_section(avoid):
+    """Prompt suffix listing stems the reader has already seen."""
+    if not avoid:
+        return ""
+    stems = "\n".join(f"- {stem[:120]}" for stem in avoid)
+    return f"""
+AVOID THESE (already used in earlier quizzes; do not repeat or rephrase them):
+{stems}
+"""
+
+@timed("build_prompt")
+def build_prompt(topic, num_questions, level, focus=None, explanations=True, avoid=None):
+    level_desc = LEVEL_DESCRIPTIONS.get(level, "appropriate for the selected level")
+    focus_line = f"\n- Focus this set on: {focus}" if focus else ""
+    requirement, formatting, example = EXPLANATION_RULES[bool(explanations)]
     
     return f"""
 You are an expert educator and assessment designer. Create EXACTLY {num_questions} high-quality multiple-choice questions about "{topic}".
@@ -13,17 +51,14 @@ You are an expert educator and assessment designer. Create EXACTLY {num_question
 REQUIREMENTS:
 - Difficulty Level: {level} ({level_desc})
 - Each question must have exactly 4 options (A, B, C, D)
-- Only ONE correct answer per question
-- Include a clear, educational explanation for each correct answer
+- Only ONE correct answer per question{requirement}
 - Questions should be well-structured, clear, and unambiguous
 - Avoid trick questions or overly complex language
-- Cover different aspects of the topic when possible
+- Cover different aspects of the topic when possible{focus_line}
 
 FORMATTING RULES:
 - Use consistent numbering (1., 2., 3., etc.)
-- Label options as A), B), C), D)
-- Start explanations with "Explanation:"
-- Keep explanations concise but informative
+- Label options as A), B), C), D){formatting}
 
 EXAMPLE FORMAT:
 1. What is the primary function of mitochondria in cells?
@@ -32,10 +67,73 @@ B) Energy production
 C) DNA storage
 D) Waste removal
 
-Answer: B
-Explanation: Mitochondria are known as the "powerhouses" of the cell because they produce ATP through cellular respiration, providing energy for cellular processes.
+Answer: B{example}
 
 NOW GENERATE {num_questions} QUESTIONS ABOUT: {topic}
 
 Remember: Focus on educational value, accuracy, and clarity. Each question should test genuine understanding of the topic.
+""" + avoid_section(avoid)
+
+
+@timed("build_prompt")
+def build_json_prompt(topic, num_questions, level, focus=None, explanations=True, avoid=None):
+    """Terse prompt for JSON mode: no example block, one-letter keys."""
+    level_desc = LEVEL_DESCRIPTIONS.get(level, "appropriate for the selected level")
+    focus_line = f"\nFocus this set on: {focus}" if focus else ""
+    explanation_field = ',"e":"one-sentence explanation"' if explanations else ""
+    return f"""Write EXACTLY {num_questions} clear, unambiguous multiple-choice questions.
+Topic: {topic}
+Level: {level} ({level_desc}){focus_line}
+Reply with JSON only: {{"q":[{{"s":"question","o":["4 options"],"a":0{explanation_field}}}]}}
+"a" is the 0-based index of the single correct option.
+""" + avoid_section(avoid)
+
+
+def build_generation_prompt(topic, num_questions, level, focus=None, explanations=True, avoid=None):
+    """Prompt in the configured output format ("text" or "json").
+
+    ``avoid`` lists stems from the user's earlier quizzes not to repeat.
+    """
+    if Config.AI_CONFIG["output_format"] == "json":
+        return build_json_prompt(topic, num_questions, level, focus, explanations, avoid)
+    return build_prompt(topic, num_questions, level, focus, explanations, avoid)
+
+
+def build_continuation_prompt(topic, num_questions, level, covered, focus=None, explanations=True):
+    """Prompt for the questions still missing after a response was cut off.
+
+    ``covered`` holds the stems already generated so they are not repeated.
+    """
+    part = f"the remaining {num_questions} questions of a larger set"
+    prompt = build_generation_prompt(
+        topic, num_questions, level, focus=f"{focus}; {part}" if focus else part, explanations=explanations
+    )
+    stems = "\n".join(f"- {stem[:120]}" for stem in covered)
+    return f"""{prompt}
+ALREADY COVERED (do not repeat or rephrase these):
+{stems}
+"""
+
+
+@timed("build_prompt")
+def build_explanation_prompt(topic, level, questions):
+    """Prompt asking for explanations of questions that already have answers.
+
+    ``questions`` is a list of ``(number, Question)`` pairs; replies are
+    keyed by those numbers (see ``quiz.parse_explanations``).
+    """
+    items = "\n\n".join(
+        f"{number}. {q.stem}\n" + "\n".join(f"{OPTION_LETTERS[i]}) {option}" for i, option in enumerate(q.options))
+        + f"\nAnswer: {q.answer}"
+        for number, q in questions
+    )
+    if Config.AI_CONFIG["output_format"] == "json":
+        reply = 'Reply with JSON only: {"e":{"<number>":"explanation"}}'
+    else:
+        reply = "Reply with one line per question, keeping its number:\n<number>. Explanation: <text>"
+    return f"""EXPLAIN THESE {len(questions)} QUESTIONS about "{topic}" ({level} level).
+For each one, explain in one or two concise, educational sentences why the given answer is correct.
+{reply}
+
+{items}
 """
\ No newline at end of file
@@ -0,0 +1,318 @@
+"""
+EduQuiz Pro Quiz Model
+Structured representation of a generated MCQ set, parsed once from LLM text.
+"""
+
+import json
+import re
+
+from metrics import timed
+
+# Line classifiers, compiled once at import time
+QUESTION_RE = re.compile(
+    r"^\s*(?:\*\*)?(?:question\s*)?(\d+)\s*[.):]\s*(?:\*\*)?\s*(.*?)\s*(?:\*\*)?\s*$", re.IGNORECASE
+)
+OPTION_RE = re.compile(r"^\s*\(?([A-Da-d])\s*[.)]\s*(.*)$")
+ANSWER_RE = re.compile(
+    r"^\s*(?:\*\*)?(?:correct\s+)?(?:answer|correct|solution)\s*:\s*(?:\*\*)?\s*\(?([A-Da-d])?\b\)?[.)]?\s*(.*)$",
+    re.IGNORECASE
+)
+EXPLANATION_RE = re.compile(r"^\s*(?:\*\*)?explanation\s*:\s*(?:\*\*)?\s*(.*)$", re.IGNORECASE)
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+
+OPTION_LETTERS = "ABCD"
+
+# Stems sharing at least this fraction of their words count as duplicates
+DUPLICATE_THRESHOLD = 0.9
+
+
+def stem_words(stem):
+    return frozenset(WORD_RE.findall(stem.lower()))
+
+
+def similarity(a, b):
+    """Jaccard overlap of two word sets."""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class Question:
+    """A single multiple-choice question."""
+
+    __slots__ = ("number", "stem", "options", "answer", "explanation")
+
+    def __init__(self, number, stem, options=None, answer=None, explanation=""):
+        self.number = number
+        self.stem = stem
+        self.options = options if options is not None else []
+        self.answer = answer
+        self.explanation = explanation
+
+    def to_dict(self):
+        return {
+            "number": self.number,
+            "stem": self.stem,
+            "options": self.options,
+            "answer": self.answer,
+            "explanation": self.explanation,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data["number"],
+            data["stem"],
+            list(data.get("options", [])),
+            data.get("answer"),
+            data.get("explanation", ""),
+        )
+
+    def problems(self, require_explanation=True):
+        """Rule violations against the format requested by ``build_prompt``."""
+        found = []
+        if not self.stem.strip():
+            found.append("missing question text")
+        if len(self.options) != len(OPTION_LETTERS) or not all(o.strip() for o in self.options):
+            found.append(f"expected {len(OPTION_LETTERS)} options, found {len(self.options)}")
+        if not self.answer or self.answer not in OPTION_LETTERS:
+            found.append("missing answer letter")
+        if require_explanation and not self.explanation.strip():
+            found.append("missing explanation")
+        return found
+
+    def to_text(self):
+        lines = [f"{self.number}. {self.stem}"]
+        lines.extend(f"{OPTION_LETTERS[i]}) {option}" for i, option in enumerate(self.options))
+        lines.append("")
+        if self.answer:
+            lines.append(f"Answer: {self.answer}")
+        if self.explanation:
+            lines.append(f"Explanation: {self.explanation}")
+        return "\n".join(lines)
+
+
+class QuizSet:
+    """An ordered set of questions plus the request that produced it."""
+
+    __slots__ = ("topic", "level", "questions")
+
+    def __init__(self, questions=None, topic="", level=""):
+        self.questions = questions if questions is not None else []
+        self.topic = topic
+        self.level = level
+
+    def __len__(self):
+        return len(self.questions)
+
+    def __iter__(self):
+        return iter(self.questions)
+
+    def to_dict(self):
+        return {
+            "topic": self.topic,
+            "level": self.level,
+            "questions": [q.to_dict() for q in self.questions],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            [Question.from_dict(q) for q in data.get("questions", [])],
+            data.get("topic", ""),
+            data.get("level", ""),
+        )
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), separators=(",", ":"), ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, raw):
+        return cls.from_dict(json.loads(raw))
+
+    def to_text(self):
+        return "\n\n".join(q.to_text() for q in self.questions)
+
+    def defects(self, threshold=DUPLICATE_THRESHOLD, require_explanation=True):
+        """Map each failing question index to its problems.
+
+        A question whose stem nearly matches an earlier one is reported as
+        the duplicate; the first occurrence is kept.
+        """
+        found = {}
+        seen = []
+        for index, question in enumerate(self.questions):
+            problems = question.problems(require_explanation)
+            words = stem_words(question.stem)
+            for other_index, other in seen:
+                if similarity(words, other) >= threshold:
+                    problems.append(f"near-duplicate of question {other_index + 1}")
+                    break
+            else:
+                seen.append((index, words))
+            if problems:
+                found[index] = problems
+        return found
+
+    def missing_explanations(self):
+        """Indices of questions still waiting for an explanation."""
+        return [i for i, q in enumerate(self.questions) if not q.explanation.strip()]
+
+    def extend(self, questions):
+        """Append ``questions`` after the existing ones, renumbering them."""
+        for question in questions:
+            self.replace(len(self.questions), question)
+
+    def replace(self, index, question):
+        """Put ``question`` at ``index`` (appending past the end), keeping numbering."""
+        question.number = index + 1
+        if index < len(self.questions):
+            self.questions[index] = question
+        else:
+            self.questions.append(question)
+
+
+_decoder = json.JSONDecoder()
+
+
+def _salvage_items(raw):
+    """Whole question objects from a JSON reply that was cut off."""
+    items = []
+    pos = raw.find("[") + 1
+    while pos > 0:
+        pos = raw.find("{", pos)
+        if pos < 0:
+            break
+        try:
+            item, pos = _decoder.raw_decode(raw, pos)
+        except ValueError:
+            break
+        items.append(item)
+    return items
+
+
+def _answer_letter(value):
+    if isinstance(value, int) and 0 <= value < len(OPTION_LETTERS):
+        return OPTION_LETTERS[value]
+    if isinstance(value, str) and value.strip().upper() in OPTION_LETTERS:
+        return value.strip().upper()
+    return None
+
+
+def question_from_item(item, number):
+    """One ``Question`` from a JSON-mode item ``{"s", "o", "a", "e"}``."""
+    return Question(
+        number,
+        str(item.get("s", "")).strip(),
+        [str(option).strip() for option in item.get("o") or []],
+        _answer_letter(item.get("a")),
+        str(item.get("e", "")).strip(),
+    )
+
+
+def is_json_output(text):
+    return text.lstrip().startswith("{")
+
+
+@timed("parse")
+def parse_quiz_json(raw, topic="", level=""):
+    """Build a ``QuizSet`` from a JSON-mode reply (see ``prompt.build_json_prompt``).
+
+    Expects ``{"q": [{"s": stem, "o": [options], "a": index, "e": explanation}]}``.
+    A truncated reply yields the questions that arrived complete.
+    """
+    try:
+        items = json.loads(raw)["q"]
+    except (ValueError, KeyError, TypeError):
+        items = _salvage_items(raw)
+
+    questions = []
+    for item in items:
+        if isinstance(item, dict):
+            questions.append(question_from_item(item, len(questions) + 1))
+    return QuizSet(questions, topic, level)
+
+
+EXPLAINED_RE = re.compile(r"^\s*(?:\*\*)?(\d+)\s*[.):]\s*(?:\*\*)?(?:explanation\s*:\s*)?(.*)$", re.IGNORECASE)
+
+
+def parse_explanations(text):
+    """Map question numbers to explanation text from an explanation reply.
+
+    Accepts ``N. Explanation: ...`` lines (continuation lines are joined) or
+    the JSON form ``{"e": {"N": "..."}}``.
+    """
+    if is_json_output(text):
+        try:
+            items = json.loads(text).get("e", {})
+            return {int(k): str(v).strip() for k, v in items.items() if str(v).strip()}
+        except (ValueError, AttributeError):
+            return {}
+
+    found = {}
+    current = None
+    for line in text.splitlines():
+        match = EXPLAINED_RE.match(line)
+        if match:
+            current = int(match.group(1))
+            found[current] = match.group(2).strip()
+        elif current is not None and line.strip():
+            found[current] = f"{found[current]} {line.strip()}".strip()
+    return {number: text for number, text in found.items() if text}
+
+
+@timed("parse")
+def parse_quiz(text, topic="", level=""):
+    """Parse raw LLM output into a ``QuizSet`` in a single pass.
+
+    Lines that match no classifier are treated as continuations of whatever
+    field was last being filled (stem, option or explanation).
+    """
+    questions = []
+    current = None
+    last_field = None
+
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+
+        match = QUESTION_RE.match(line)
+        if match:
+            current = Question(int(match.group(1)), match.group(2))
+            questions.append(current)
+            last_field = "stem"
+            continue
+
+        if current is None:
+            continue
+
+        match = OPTION_RE.match(line)
+        if match and current.answer is None and len(current.options) < len(OPTION_LETTERS):
+            current.options.append(match.group(2).strip())
+            last_field = "option"
+            continue
+
+        match = ANSWER_RE.match(line)
+        if match:
+            if match.group(1):
+                current.answer = match.group(1).upper()
+            last_field = "answer"
+            continue
+
+        match = EXPLANATION_RE.match(line)
+        if match:
+            current.explanation = match.group(1).strip()
+            last_field = "explanation"
+            continue
+
+        extra = line.strip()
+        if last_field == "stem":
+            current.stem = f"{current.stem} {extra}".strip()
+        elif last_field == "option":
+            current.options[-1] = f"{current.options[-1]} {extra}"
+        elif last_field in ("answer", "explanation"):
+            current.explanation = f"{current.explanation} {extra}".strip()
+            last_field = "explanation"
+
+    return QuizSet(questions, topic, level)
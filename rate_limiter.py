@@ -0,0 +1,278 @@
+"""
+EduQuiz Pro Rate Limiter
+Process-wide (optionally cross-process) token bucket for Groq API calls,
+with fair FIFO queueing and jittered exponential backoff on 429/5xx.
+"""
+
+import asyncio
+import random
+import sqlite3
+import threading
+import time
+
+from config import Config
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+def estimate_tokens(prompt, max_tokens=None):
+    """Rough prompt size (~4 chars/token) plus the completion allowance."""
+    return len(prompt) // 4 + (max_tokens or 2000)
+
+
+def status_code(exc):
+    """HTTP status carried by a Groq/httpx exception, if any."""
+    code = getattr(exc, "status_code", None)
+    if code is None:
+        code = getattr(getattr(exc, "response", None), "status_code", None)
+    return code
+
+
+def is_retryable(exc):
+    return status_code(exc) in RETRYABLE_STATUS
+
+
+def backoff_delay(attempt, exc=None):
+    """Full-jitter exponential delay, honouring a server Retry-After."""
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        retry_after = float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        retry_after = None
+    ceiling = min(Config.RATE_LIMITS["backoff_cap"], Config.RATE_LIMITS["backoff_base"] * 2 ** attempt)
+    delay = random.uniform(0, ceiling)
+    return max(delay, retry_after) if retry_after is not None else delay
+
+
+class RateLimiter:
+    """Two token buckets (requests and LLM tokens) refilled every minute.
+
+    Callers take a ticket and are served strictly in arrival order, so a
+    large request is not starved by a stream of small ones. With ``db_name``
+    the bucket state lives in SQLite and is shared by every process using
+    that file.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, db_name=None):
+        self.requests_per_minute = requests_per_minute or Config.RATE_LIMITS["requests_per_minute"]
+        self.tokens_per_minute = tokens_per_minute or Config.RATE_LIMITS["tokens_per_minute"]
+        self.db_name = db_name
+        self._lock = threading.Lock()
+        self._requests = float(self.requests_per_minute)
+        self._tokens = float(self.tokens_per_minute)
+        self._updated = time.monotonic()
+        self._next_ticket = 0
+        self._serving = 0
+        self._abandoned = set()
+        if db_name:
+            self._create_table()
+
+    # ---- bucket state -------------------------------------------------
+
+    def _create_table(self):
+        conn = sqlite3.connect(self.db_name, timeout=5)
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS rate_limit_bucket (
+            name TEXT PRIMARY KEY,
+            requests REAL,
+            tokens REAL,
+            updated_at REAL
+        )
+        """)
+        conn.commit()
+        conn.close()
+
+    def _refill(self, requests, tokens, elapsed):
+        requests = min(self.requests_per_minute, requests + elapsed * self.requests_per_minute / 60)
+        tokens = min(self.tokens_per_minute, tokens + elapsed * self.tokens_per_minute / 60)
+        return requests, tokens
+
+    def _wait_needed(self, available_requests, available_tokens, requests, tokens):
+        return max(
+            (requests - available_requests) * 60 / self.requests_per_minute,
+            (tokens - available_tokens) * 60 / self.tokens_per_minute,
+            0.0,
+        )
+
+    def _take_local(self, requests, tokens):
+        now = time.monotonic()
+        self._requests, self._tokens = self._refill(self._requests, self._tokens, now - self._updated)
+        self._updated = now
+        wait = self._wait_needed(self._requests, self._tokens, requests, tokens)
+        if wait == 0:
+            self._requests -= requests
+            self._tokens -= tokens
+        return wait
+
+    def _take_shared(self, requests, tokens):
+        conn = sqlite3.connect(self.db_name, timeout=5, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            row = conn.execute(
+                "SELECT requests, tokens, updated_at FROM rate_limit_bucket WHERE name='groq'"
+            ).fetchone()
+            if row is None:
+                available = (float(self.requests_per_minute), float(self.tokens_per_minute))
+            else:
+                available = self._refill(row[0], row[1], now - row[2])
+            wait = self._wait_needed(available[0], available[1], requests, tokens)
+            if wait == 0:
+                available = (available[0] - requests, available[1] - tokens)
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_limit_bucket (name, requests, tokens, updated_at) "
+                "VALUES ('groq', ?, ?, ?)",
+                (available[0], available[1], now)
+            )
+            conn.execute("COMMIT")
+            return wait
+        finally:
+            conn.close()
+
+    # ---- fair queue ---------------------------------------------------
+
+    def _enqueue(self):
+        with self._lock:
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            return ticket
+
+    def _advance(self):
+        self._serving += 1
+        while self._serving in self._abandoned:
+            self._abandoned.discard(self._serving)
+            self._serving += 1
+
+    def _position(self, ticket):
+        with self._lock:
+            return ticket - self._serving
+
+    def _granted(self, ticket, wait):
+        if wait == 0:
+            with self._lock:
+                if ticket == self._serving:
+                    self._advance()
+        return 0, wait
+
+    def _try_take(self, ticket, requests, tokens):
+        """Return (queue position, seconds to wait); (0, 0) means granted."""
+        with self._lock:
+            position = ticket - self._serving
+            if position > 0:
+                return position, 0.05
+            if not self.db_name:
+                wait = self._take_local(requests, tokens)
+                if wait == 0:
+                    self._advance()
+                return 0, wait
+        # Only the head ticket gets here, so the SQLite transaction (which can
+        # block for the busy timeout) runs without holding the lock
+        return self._granted(ticket, self._take_shared(requests, tokens))
+
+    async def _atry_take(self, ticket, requests, tokens):
+        """``_try_take`` with the shared-state transaction off the event loop."""
+        if self.db_name and self._position(ticket) == 0:
+            wait = await asyncio.to_thread(self._take_shared, requests, tokens)
+            return self._granted(ticket, wait)
+        return self._try_take(ticket, requests, tokens)
+
+    def _abandon(self, ticket):
+        with self._lock:
+            if ticket == self._serving:
+                self._advance()
+            elif ticket > self._serving:
+                self._abandoned.add(ticket)
+
+    def _clip(self, requests, tokens):
+        # Anything bigger than a full bucket would otherwise wait forever
+        return min(requests, self.requests_per_minute), min(tokens, self.tokens_per_minute)
+
+    def acquire(self, requests=1, tokens=0, on_wait=None):
+        """Block the calling thread until capacity is available."""
+        requests, tokens = self._clip(requests, tokens)
+        ticket = self._enqueue()
+        started = time.monotonic()
+        granted = False
+        try:
+            while True:
+                position, wait = self._try_take(ticket, requests, tokens)
+                if position == 0 and wait == 0:
+                    granted = True
+                    return time.monotonic() - started
+                if on_wait:
+                    on_wait(position + 1, time.monotonic() - started)
+                time.sleep(min(wait, 0.5))
+        finally:
+            if not granted:
+                self._abandon(ticket)
+
+    async def aacquire(self, requests=1, tokens=0, on_wait=None):
+        """Asynchronous ``acquire`` for code running on an event loop."""
+        requests, tokens = self._clip(requests, tokens)
+        ticket = self._enqueue()
+        started = time.monotonic()
+        granted = False
+        try:
+            while True:
+                position, wait = await self._atry_take(ticket, requests, tokens)
+                if position == 0 and wait == 0:
+                    granted = True
+                    return time.monotonic() - started
+                if on_wait:
+                    on_wait(position + 1, time.monotonic() - started)
+                await asyncio.sleep(min(wait, 0.5))
+        finally:
+            if not granted:
+                self._abandon(ticket)
+
+    def queue_length(self):
+        with self._lock:
+            return self._next_ticket - self._serving - len(self._abandoned)
+
+
+def limited_call(func, tokens, on_wait=None, limiter=None):
+    """Call ``func()`` under the limiter, retrying 429/5xx with backoff."""
+    limiter = limiter or get_limiter()
+    for attempt in range(Config.RATE_LIMITS["max_retries"] + 1):
+        limiter.acquire(1, tokens, on_wait)
+        try:
+            return func()
+        except Exception as e:
+            if not is_retryable(e) or attempt == Config.RATE_LIMITS["max_retries"]:
+                raise
+            time.sleep(backoff_delay(attempt, e))
+
+
+async def alimited_call(factory, tokens, on_wait=None, limiter=None):
+    """Await ``factory()`` under the limiter, retrying 429/5xx with backoff."""
+    limiter = limiter or get_limiter()
+    for attempt in range(Config.RATE_LIMITS["max_retries"] + 1):
+        await limiter.aacquire(1, tokens, on_wait)
+        try:
+            return await factory()
+        except Exception as e:
+            if not is_retryable(e) or attempt == Config.RATE_LIMITS["max_retries"]:
+                raise
+            await asyncio.sleep(backoff_delay(attempt, e))
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter():
+    """Process-wide limiter shared by all sessions and the bulk CLI."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            db_name = Config.DATABASE["name"] if Config.RATE_LIMITS["shared"] else None
+            _limiter = RateLimiter(db_name=db_name)
+        return _limiter
+
+
+def set_limiter(limiter):
+    """Replace the process-wide limiter (e.g. with CLI-specified budgets)."""
+    global _limiter
+    with _limiter_lock:
+        _limiter = limiter
+        return limiter
@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rate_limiter import RateLimiter, get_limiter, set_limiter  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def unlimited():
+    """Mock LLM calls should not wait on the Groq request budget."""
+    previous = get_limiter()
+    set_limiter(RateLimiter(10 ** 6, 10 ** 9))
+    yield
+    set_limiter(previous)
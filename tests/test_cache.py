@@ -0,0 +1,70 @@
+"""
+Cache keys, what may be cached, and single-flight sharing.
+"""
+
+import threading
+
+import pytest
+
+from cache import SingleFlight, cacheable, make_key
+from llm_backend import sample_mcq_text
+from quiz import parse_quiz
+
+
+def test_key_normalizes_topic_and_separates_variants():
+    key = make_key("Cell  Biology", 5, "Easy", "m")
+    assert key == make_key("cell biology", 5, "easy", "m")
+    assert key != make_key("cell biology", 5, "easy", "m", explanations=False)
+    assert key != make_key("cell biology", 5, "easy", "m", output_format="json")
+    assert key != make_key("cell biology", 5, "easy", "m", prompt_version="0")
+
+
+def test_only_full_valid_sets_are_cacheable():
+    quiz = parse_quiz(sample_mcq_text(5))
+    assert cacheable(quiz, 5)
+    assert not cacheable(quiz, 6)
+    quiz.questions[2].answer = None
+    assert not cacheable(quiz, 5)
+
+
+def test_concurrent_callers_share_one_execution():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+    joined = []
+    results = []
+
+    def work():
+        calls.append(1)
+        release.wait(5)
+        return "quiz"
+
+    def join():
+        joined.append(1)
+        if len(joined) == 2:
+            release.set()
+
+    def caller():
+        results.append(flight.do("key", work, on_join=join))
+
+    threads = [threading.Thread(target=caller) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert sorted(results) == [("quiz", False), ("quiz", True), ("quiz", True)]
+    assert flight.in_flight() == 0
+
+
+def test_leader_errors_clear_the_key():
+    flight = SingleFlight()
+
+    def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        flight.do("key", fail)
+    assert flight.in_flight() == 0
+    assert flight.do("key", lambda: 1) == (1, False)
@@ -0,0 +1,185 @@
+"""
+Streaming parsers, continuation of cut-off responses and targeted repair,
+against the deterministic MockLLM.
+"""
+
+import asyncio
+
+from dedup import StemIndex
+from generator import (
+    IncrementalJSONParser,
+    IncrementalMCQParser,
+    acontinue_truncated,
+    arepair_quiz,
+    is_complete_question,
+    stream_mcqs
+)
+from llm_backend import MockLLM, sample_mcq_json, sample_mcq_text
+from quiz import parse_quiz, parse_quiz_json
+
+
+class RecordingLLM(MockLLM):
+    """MockLLM that remembers every prompt it was sent."""
+
+    def __init__(self, **kwargs):
+        super().__init__(ttft=0, tokens_per_sec=10 ** 9, **kwargs)
+        self.prompts = []
+
+    async def ainvoke(self, prompt):
+        self.prompts.append(prompt)
+        return await super().ainvoke(prompt)
+
+
+def mock(json_mode=False, **kwargs):
+    return RecordingLLM(json_mode=json_mode, **kwargs)
+
+
+def continue_truncated(llm, quiz, num_questions, finish_reason, json_reply=False):
+    return asyncio.run(acontinue_truncated(llm, quiz, num_questions, finish_reason, json_reply=json_reply))
+
+
+def test_complete_response_is_returned_as_is():
+    quiz = parse_quiz(sample_mcq_text(5), topic="Cell Biology", level="Medium")
+    result, tokens = continue_truncated(mock(), quiz, 5, "stop")
+    assert result is quiz
+    assert tokens == 0
+
+
+def test_json_truncation_keeps_whole_items():
+    reply = sample_mcq_json(5)
+    starts = [i for i in range(len(reply)) if reply.startswith('{"s"', i)]
+    cut = reply[:starts[2] + 40]  # mid-way through the third item
+    quiz = parse_quiz_json(cut, topic="Cell Biology", level="Medium")
+    assert len(quiz) == 2
+    kept = [q.stem for q in quiz]
+
+    llm = mock(json_mode=True)
+    result, tokens = continue_truncated(llm, quiz, 5, "length", json_reply=True)
+
+    # Both whole items survive the token-limit stop; only the missing three are requested
+    assert "EXACTLY 3" in llm.prompts[0]
+    assert tokens > 0
+    assert len(result) == 5
+    assert [q.stem for q in result][:2] == kept
+    assert [q.number for q in result] == [1, 2, 3, 4, 5]
+    assert all(is_complete_question(q) for q in result)
+
+
+def test_text_truncation_drops_the_cut_question():
+    reply = sample_mcq_text(5)
+    cut = reply[:reply.index("Explanation:", reply.index("3. ")) + 30]
+    quiz = parse_quiz(cut, topic="Cell Biology", level="Medium")
+    assert len(quiz) == 3
+    kept = [q.stem for q in quiz][:2]
+
+    llm = mock()
+    result, _ = continue_truncated(llm, quiz, 5, "length")
+
+    assert "EXACTLY 3" in llm.prompts[0]
+    assert len(result) == 5
+    assert [q.stem for q in result][:2] == kept
+    assert result.questions[2].explanation != quiz.questions[2].explanation
+    assert all(is_complete_question(q) for q in result)
+
+
+def test_json_truncation_by_token_limit_end_to_end():
+    llm = mock(json_mode=True, max_tokens=250)
+    reply = llm.invoke("Generate EXACTLY 5 questions. Topic: Cell Biology")
+    assert reply.response_metadata["finish_reason"] == "length"
+    quiz = parse_quiz_json(reply.content, topic="Cell Biology", level="Medium")
+    first = len(quiz)
+
+    result, _ = continue_truncated(llm, quiz, 5, "length", json_reply=True)
+
+    assert f"EXACTLY {5 - first}" in llm.prompts[0]
+    assert len(result) == 5
+    assert [q.stem for q in result][:first] == [q.stem for q in quiz]
+
+
+def pieces(text, size=7):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def test_text_parser_emits_each_question_once_it_closes():
+    parser = IncrementalMCQParser()
+    emitted = []
+    for piece in pieces(sample_mcq_text(4)):
+        emitted.extend(parser.feed(piece))
+    assert len(emitted) == 3  # the last one closes only at the end of the stream
+    emitted.extend(parser.flush())
+    assert [block.split(".", 1)[0] for block in emitted] == ["1", "2", "3", "4"]
+    assert parser.preamble == ["Here are 4 questions about Cell Biology:"]
+
+
+def test_json_parser_emits_whole_items_while_streaming():
+    reply = sample_mcq_json(4)
+    parser = IncrementalJSONParser()
+    counts = []
+    for piece in pieces(reply):
+        parser.feed(piece)
+        counts.append(len(parser.questions))
+    assert counts[-1] == 4
+    assert counts.index(1) < counts.index(4)  # questions arrived before the reply ended
+    assert [q.to_dict() for q in parser.questions] == [q.to_dict() for q in parse_quiz_json(reply)]
+    assert parser.flush() == []
+
+
+def test_stream_mcqs_reports_questions_in_both_formats():
+    for json_mode in (False, True):
+        shown = []
+        quiz, stats = stream_mcqs(
+            mock(json_mode=json_mode), "Create EXACTLY 3 questions", on_question=lambda i, block: shown.append(i),
+            topic="Cell Biology", level="Easy"
+        )
+        assert shown == [1, 2, 3]
+        assert stats.json_reply is json_mode
+        assert (len(quiz), quiz.topic, quiz.level) == (3, "Cell Biology", "Easy")
+        assert not quiz.defects()
+
+
+def repair(llm, quiz, num_questions, **kwargs):
+    return asyncio.run(arepair_quiz(llm, quiz, num_questions, **kwargs))
+
+
+def test_repair_replaces_only_failing_questions():
+    quiz = parse_quiz(sample_mcq_text(5), topic="Cell Biology", level="Medium")
+    quiz.questions[1].answer = None
+    quiz.questions[3].options = quiz.questions[3].options[:3]
+    before = [q.stem for q in quiz]
+
+    llm = mock()
+    repaired, tokens = repair(llm, quiz, 5)
+
+    assert repaired is quiz
+    assert tokens > 0
+    assert len(llm.prompts) == 1
+    assert "EXACTLY 2" in llm.prompts[0]
+    assert not quiz.defects()
+    stems = [q.stem for q in quiz]
+    assert [stems[i] for i in (0, 2, 4)] == [before[i] for i in (0, 2, 4)]
+    assert stems[1] != before[1] and stems[3] != before[3]
+    assert [q.number for q in quiz] == [1, 2, 3, 4, 5]
+
+
+def test_repair_fills_a_short_set():
+    quiz = parse_quiz(sample_mcq_text(3), topic="Cell Biology", level="Medium")
+    repaired, _ = repair(mock(), quiz, 5)
+    assert len(repaired) == 5
+    assert not repaired.defects()
+
+
+def test_valid_set_needs_no_repair_calls():
+    quiz = parse_quiz(sample_mcq_text(5), topic="Cell Biology", level="Medium")
+    llm = mock()
+    _, tokens = repair(llm, quiz, 5)
+    assert tokens == 0
+    assert llm.prompts == []
+
+
+def test_repair_replaces_questions_the_user_has_seen():
+    quiz = parse_quiz(sample_mcq_text(3), topic="Cell Biology", level="Medium")
+    seen = StemIndex()
+    seen.add(quiz.questions[0].stem)
+    repaired, _ = repair(mock(), quiz, 3, seen=seen)
+    assert seen.match(repaired.questions[0].stem) is None
+    assert not repaired.defects()
@@ -0,0 +1,52 @@
+"""
+Model routing and the hedged primary/fallback wrapper.
+"""
+
+import asyncio
+
+from config import Config
+from llm_backend import HedgedLLM, MockLLM, choose_model
+
+SMALL = Config.ROUTING["small_model"]
+LARGE = Config.AI_CONFIG["model_name"]
+
+
+def bucket_stats(small_latency, large_latency, generations=None):
+    generations = generations if generations is not None else Config.ROUTING["min_samples"]
+    return {
+        model: {"bucket_generations": generations, "bucket_avg_latency": latency}
+        for model, latency in ((SMALL, small_latency), (LARGE, large_latency))
+    }
+
+
+def test_rule_routes_small_sets_to_the_small_model():
+    assert choose_model(3, "Easy") == SMALL
+    assert choose_model(50, "Easy") == LARGE
+    assert choose_model(1, "Hard") == LARGE
+
+
+def test_observed_latency_in_the_same_bucket_overrides_the_rule():
+    assert choose_model(3, "Easy", bucket_stats(1.0, 2.0)) == SMALL
+    assert choose_model(3, "Easy", bucket_stats(3.0, 2.0)) == LARGE
+    # Too few samples to trust yet
+    assert choose_model(3, "Easy", bucket_stats(3.0, 2.0, generations=1)) == SMALL
+
+
+def fast(**kwargs):
+    return MockLLM(ttft=0.01, tokens_per_sec=10 ** 9, **kwargs)
+
+
+def test_error_falls_back_to_the_secondary():
+    llm = HedgedLLM(fast(model_name="p", failure_rate=1.0), fast(model_name="s"), hedge_after=5)
+    response = asyncio.run(llm.ainvoke("Create EXACTLY 2 questions"))
+    assert response.response_metadata["route"] == "fallback"
+    assert response.response_metadata["model_name"] == "s"
+
+
+def test_slow_primary_is_hedged():
+    slow = MockLLM(model_name="p", ttft=0.01, tokens_per_sec=10 ** 9, slow_rate=1.0, slow_ttft=2.0)
+    llm = HedgedLLM(slow, fast(model_name="s"), hedge_after=0.05, hedge_ttft_after=0.05)
+    assert asyncio.run(llm.ainvoke("Create EXACTLY 2 questions")).response_metadata["route"] == "hedge"
+    assert llm.invoke("Create EXACTLY 2 questions").response_metadata["route"] == "hedge"
+    first = next(iter(llm.stream("Create EXACTLY 2 questions")))
+    assert first.response_metadata["route"] == "hedge"
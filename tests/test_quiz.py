@@ -0,0 +1,65 @@
+"""
+Parsing and validation of generated question sets.
+"""
+
+from llm_backend import sample_mcq_json, sample_mcq_text
+from quiz import Question, QuizSet, parse_explanations, parse_quiz, parse_quiz_json
+
+
+def question(number, stem, options=None, answer="B", explanation="Because B is right."):
+    options = options if options is not None else ["One", "Two", "Three", "Four"]
+    return Question(number, stem, options, answer, explanation)
+
+
+def test_text_and_json_replies_parse_to_the_same_set():
+    text = parse_quiz(sample_mcq_text(5), topic="Cell Biology", level="Medium")
+    json_mode = parse_quiz_json(sample_mcq_json(5), topic="Cell Biology", level="Medium")
+    assert len(text) == 5
+    assert [q.to_dict() for q in text] == [q.to_dict() for q in json_mode]
+    assert not text.defects()
+
+
+def test_truncated_json_keeps_only_whole_items():
+    reply = sample_mcq_json(5)
+    quiz = parse_quiz_json(reply[:len(reply) // 2])
+    assert 0 < len(quiz) < 5
+    assert not quiz.defects()
+
+
+def test_defects_flag_each_rule():
+    quiz = QuizSet([
+        question(1, "Which organelle makes ATP?"),
+        question(2, "Which base pairs with adenine?", options=["One", "Two", "Three"]),
+        question(3, "Which molecule stores genetic information?", answer=None),
+        question(4, "Which structure controls what enters a cell?", explanation=""),
+        question(5, "Which organelle makes ATP?"),
+    ])
+
+    defects = quiz.defects()
+
+    assert sorted(defects) == [1, 2, 3, 4]
+    assert defects[1] == ["expected 4 options, found 3"]
+    assert defects[2] == ["missing answer letter"]
+    assert defects[3] == ["missing explanation"]
+    assert defects[4] == ["near-duplicate of question 1"]
+
+
+def test_questions_only_sets_do_not_need_explanations():
+    quiz = QuizSet([question(1, "Which organelle makes ATP?", explanation="")])
+    assert quiz.defects(require_explanation=False) == {}
+    assert quiz.missing_explanations() == [0]
+
+
+def test_replace_and_extend_keep_numbering():
+    quiz = QuizSet([question(1, "First stem here"), question(2, "Second stem here")])
+    quiz.replace(1, question(9, "Replacement stem"))
+    quiz.extend([question(9, "Appended stem")])
+    assert [q.number for q in quiz] == [1, 2, 3]
+    assert [q.stem for q in quiz] == ["First stem here", "Replacement stem", "Appended stem"]
+
+
+def test_explanation_replies_in_both_formats():
+    assert parse_explanations("1. Explanation: First\ncontinued\n2. Second") == {
+        1: "First continued", 2: "Second"
+    }
+    assert parse_explanations('{"e":{"3":"Third","4":""}}') == {3: "Third"}
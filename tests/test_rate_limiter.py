@@ -0,0 +1,60 @@
+"""
+Token-bucket limiter: budgets, fair ordering and shared SQLite state.
+"""
+
+import asyncio
+import os
+import threading
+
+from rate_limiter import RateLimiter
+
+
+def test_budget_is_spent_then_refilled_over_time():
+    limiter = RateLimiter(requests_per_minute=2, tokens_per_minute=1000)
+    assert limiter._try_take(limiter._enqueue(), 1, 10) == (0, 0)
+    assert limiter._try_take(limiter._enqueue(), 1, 10) == (0, 0)
+    position, wait = limiter._try_take(limiter._enqueue(), 1, 10)
+    assert position == 0
+    assert 29 < wait <= 30  # one request refills every 30s
+
+
+def test_later_tickets_wait_their_turn():
+    limiter = RateLimiter(requests_per_minute=1, tokens_per_minute=1000)
+    first, second = limiter._enqueue(), limiter._enqueue()
+    assert limiter._try_take(second, 1, 1) == (1, 0.05)
+    assert limiter._try_take(first, 1, 1) == (0, 0)
+    assert limiter.queue_length() == 1
+
+
+def test_abandoned_tickets_are_skipped():
+    limiter = RateLimiter(requests_per_minute=100, tokens_per_minute=1000)
+    first, second, third = limiter._enqueue(), limiter._enqueue(), limiter._enqueue()
+    limiter._abandon(second)
+    assert limiter._try_take(first, 1, 1) == (0, 0)
+    assert limiter._try_take(third, 1, 1) == (0, 0)
+    assert limiter.queue_length() == 0
+
+
+def test_oversized_requests_are_clipped_to_a_full_bucket():
+    limiter = RateLimiter(requests_per_minute=10, tokens_per_minute=100)
+    assert limiter.acquire(1, 10 ** 6) < 1
+
+
+def test_shared_state_is_seen_by_every_limiter(tmp_path):
+    db_name = os.path.join(tmp_path, "limits.db")
+    one = RateLimiter(requests_per_minute=2, tokens_per_minute=1000, db_name=db_name)
+    two = RateLimiter(requests_per_minute=2, tokens_per_minute=1000, db_name=db_name)
+    one.acquire(1, 10)
+    asyncio.run(two.aacquire(1, 10))
+    _, wait = one._try_take(one._enqueue(), 1, 10)
+    assert wait > 0
+
+
+def test_concurrent_acquires_are_all_granted():
+    limiter = RateLimiter(requests_per_minute=10 ** 6, tokens_per_minute=10 ** 9)
+    threads = [threading.Thread(target=limiter.acquire, args=(1, 10)) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert limiter.queue_length() == 0
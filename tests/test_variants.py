@@ -0,0 +1,65 @@
+"""
+Exam variant shuffling: answers must follow their option text.
+"""
+
+import random
+
+from quiz import Question, QuizSet, OPTION_LETTERS
+from variants import make_variants, shuffle_options
+
+
+def answer_text(question):
+    return question.options[OPTION_LETTERS.index(question.answer)]
+
+
+def make_quiz():
+    questions = [
+        Question(1, "Which organelle makes ATP?", ["Nucleus", "Mitochondrion", "Ribosome", "Golgi body"], "B"),
+        Question(2, "Which base pairs with adenine in DNA?", ["Cytosine", "Guanine", "Uracil", "Thymine"], "D"),
+        Question(3, "Which are lipids?", ["Cholesterol", "Glucose", "Both A and C", "Phospholipids"], "C"),
+        Question(4, "Which cells lack a nucleus?", ["Neurons", "Red blood cells", "Hepatocytes", "None of these"], "B"),
+    ]
+    return QuizSet(questions, "Cell Biology", "Medium")
+
+
+def test_answers_follow_their_option_text():
+    quiz = make_quiz()
+    for variant in make_variants(quiz, count=6, seed=7):
+        for position, question in enumerate(variant.quiz):
+            original = quiz.questions[variant.order[position]]
+            assert question.stem == original.stem
+            assert sorted(question.options) == sorted(original.options)
+            assert answer_text(question) == answer_text(original)
+
+
+def test_options_are_actually_shuffled():
+    quiz = make_quiz()
+    orders = {
+        tuple(variant.quiz.questions[variant.order.index(0)].options)
+        for variant in make_variants(quiz, count=10, seed=1)
+    }
+    assert len(orders) > 1
+
+
+def test_letter_references_keep_option_order():
+    question = make_quiz().questions[2]
+    for seed in range(20):
+        shuffled = shuffle_options(question, random.Random(seed))
+        assert shuffled.options == question.options
+        assert shuffled.answer == "C"
+
+
+def test_trailing_catch_all_stays_last():
+    question = make_quiz().questions[3]
+    for seed in range(20):
+        shuffled = shuffle_options(question, random.Random(seed))
+        assert shuffled.options[-1] == "None of these"
+        assert answer_text(shuffled) == "Red blood cells"
+
+
+def test_same_seed_reproduces_papers():
+    quiz = make_quiz()
+    first = make_variants(quiz, count=3, seed=42)
+    second = make_variants(quiz, count=3, seed=42)
+    assert [v.order for v in first] == [v.order for v in second]
+    assert [v.answers() for v in first] == [v.answers() for v in second]
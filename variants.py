@@ -0,0 +1,120 @@
+"""
+EduQuiz Pro Exam Variants
+Shuffled versions of one quiz for anti-copying exam papers, built locally.
+
+Each version reorders the questions and each question's options with its
+own seeded RNG, so the same seed always reproduces the same papers and no
+LLM call is needed.
+"""
+
+import random
+import re
+
+from config import Config
+from metrics import timed
+from quiz import Question, QuizSet, OPTION_LETTERS
+
+# An option naming other options by letter or position ("Both A and C",
+# "Option B", "All of the above") keeps the whole question unshuffled
+REFERENCE_OPTION_RE = re.compile(
+    r"(?i:\b(?:above|below)\b)"
+    r"|\b[A-D]\s*(?:,|&|(?i:and|or|nor))\s*[A-D]\b"
+    r"|(?i:\b(?:options?|choices?|both|either|neither|only)\s+)[A-D]\b"
+)
+
+# Catch-all answers that read naturally only as the last choices
+CATCH_ALL_RE = re.compile(
+    r"^\s*(?:(?:all|none|any)(?:\s+of\s+(?:these|them|the\s+options))?|not\s+enough\s+information)\s*\.?\s*$",
+    re.IGNORECASE
+)
+
+
+class ExamVariant:
+    """One shuffled version of a quiz.
+
+    ``order[i]`` is the original index of the question printed at position
+    ``i``, which lets answer keys and grading map back to the master copy.
+    """
+
+    __slots__ = ("label", "seed", "quiz", "order")
+
+    def __init__(self, label, seed, quiz, order):
+        self.label = label
+        self.seed = seed
+        self.quiz = quiz
+        self.order = order
+
+    def answers(self):
+        return [q.answer for q in self.quiz]
+
+
+def version_label(index):
+    """A, B, ..., Z, AA, AB, ... like spreadsheet columns."""
+    label = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        label = chr(ord("A") + remainder) + label
+    return label
+
+
+def shuffle_options(question, rng):
+    """Copy of ``question`` with its options shuffled and the answer remapped.
+
+    Trailing catch-alls ("None of these") stay last; a question whose
+    options refer to each other is copied with its options in order.
+    """
+    options = question.options
+    if any(REFERENCE_OPTION_RE.search(option) for option in options):
+        movable = []
+    else:
+        end = len(options)
+        while end and CATCH_ALL_RE.match(options[end - 1]):
+            end -= 1
+        movable = list(range(end))
+    shuffled = movable[:]
+    rng.shuffle(shuffled)
+    order = list(range(len(options)))
+    for slot, source in zip(movable, shuffled):
+        order[slot] = source
+
+    answer = question.answer
+    if answer and answer in OPTION_LETTERS and OPTION_LETTERS.index(answer) < len(options):
+        answer = OPTION_LETTERS[order.index(OPTION_LETTERS.index(answer))]
+    return Question(
+        question.number,
+        question.stem,
+        [options[i] for i in order],
+        answer,
+        question.explanation,
+    )
+
+
+def make_variant(quiz, label, seed, shuffle_questions=True):
+    """Build one ``ExamVariant`` of ``quiz`` from ``seed``."""
+    rng = random.Random(f"{seed}|{label}")
+    order = list(range(len(quiz)))
+    if shuffle_questions:
+        rng.shuffle(order)
+    shuffled = QuizSet([], quiz.topic, quiz.level)
+    for index in order:
+        shuffled.extend([shuffle_options(quiz.questions[index], rng)])
+    return ExamVariant(label, seed, shuffled, order)
+
+
+@timed("exam_variants")
+def make_variants(quiz, count=None, seed=None, shuffle_questions=True):
+    """``count`` shuffled versions of ``quiz`` labelled A, B, C, ...
+
+    Args:
+        quiz: The master ``QuizSet``; it is not modified.
+        count: Number of versions (defaults to ``Config.EXAMS["default_versions"]``).
+        seed: Any hashable value; the same seed reproduces the same papers.
+        shuffle_questions: Set False to shuffle only the options.
+    """
+    count = count or Config.EXAMS["default_versions"]
+    seed = seed if seed is not None else random.randrange(10 ** 6)
+    return [
+        make_variant(quiz, version_label(i), seed, shuffle_questions)
+        for i in range(count)
+    ]